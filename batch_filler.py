@@ -0,0 +1,242 @@
+"""Fills many grids in parallel workers that share one loaded dictionary."""
+import json
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from puzzle import Puzzle
+from puzzle_archive import ARCHIVE_EXTENSION, ArchiveWriter
+from puzzle_filler import FILL_STRATEGIES
+from worker_filler import get_worker_puzzle_filler, init_worker_puzzle_filler
+from worker_filler import load_worker_puzzle_filler
+
+# "archive" appends every grid to one puzzle archive per worker
+OUTPUT_FORMATS = ("puz", "ascii", "archive")
+
+# Opened by each worker on its first archived grid.
+_worker_archive_writer: Optional[ArchiveWriter] = None
+
+
+@dataclass
+class GridSpec:
+    puzzle_id: str
+    # the Puzzle.import_from_ascii format
+    puzzle_ascii: str
+    # why the spec couldn't be read, if it couldn't; such grids are
+    # reported as errors instead of filled
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    puzzle_id: str
+    success: bool
+    # "solved", or why the fill stopped short, as in FillResult; grids that
+    # ran out of budget are written out with their best partial fill.
+    # "error" means the grid raised, and nothing was written for it.
+    status: str
+    # -1 for grids that raised
+    num_failed_entries: int
+    elapsed_seconds: float
+    output_file: str
+    error: Optional[str] = None
+
+
+# Reads grid specs from a directory of ASCII puzzle files, or from a JSONL
+# file ("-" for stdin) with one grid per line, either
+#   {"id": "...", "ascii": "<Puzzle.import_from_ascii format>"}
+# or
+#   {"id": "...", "rows": 15, "cols": 15, "black_squares": [[r, c], ...]}
+# where black squares are mirrored like in Puzzle.mark_black_squares.
+def read_grid_specs(path: str, stdin: Optional[IO[str]] = None) -> Iterator[GridSpec]:
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            file_path = os.path.join(path, filename)
+            if not os.path.isfile(file_path):
+                continue
+            with open(file_path, "r") as f:
+                yield GridSpec(os.path.splitext(filename)[0], f.read())
+        return
+
+    if path == "-":
+        yield from _read_jsonl_specs(stdin)
+        return
+
+    with open(path, "r") as f:
+        yield from _read_jsonl_specs(f)
+
+
+def _read_jsonl_specs(lines: Iterable[str]) -> Iterator[GridSpec]:
+    for line_number, line in enumerate(lines):
+        if not line.strip():
+            continue
+        # a bad line fails its own grid, not the whole batch
+        try:
+            yield grid_spec_from_json(json.loads(line), str(line_number))
+        except Exception as e:
+            yield GridSpec(str(line_number), "", error=repr(e))
+
+
+# Converts one parsed JSONL grid (see read_grid_specs) to a GridSpec.
+def grid_spec_from_json(spec: dict, default_id: str) -> GridSpec:
+    puzzle_id = str(spec.get("id", default_id))
+    if "ascii" in spec:
+        return GridSpec(puzzle_id, spec["ascii"])
+
+    rows, cols = spec["rows"], spec["cols"]
+    if not (isinstance(rows, int) and isinstance(cols, int) and rows > 0 and cols > 0):
+        raise ValueError(f"{puzzle_id}: bad grid size {rows!r}x{cols!r}")
+    black_squares = [tuple(c) for c in spec["black_squares"]]
+    for coordinate in black_squares:
+        # negative indices would wrap around instead of failing
+        if not (
+            len(coordinate) == 2
+            and all(isinstance(i, int) for i in coordinate)
+            and 0 <= coordinate[0] < rows
+            and 0 <= coordinate[1] < cols
+        ):
+            raise ValueError(f"{puzzle_id}: black square {list(coordinate)} is outside the grid")
+
+    puzzle = Puzzle(rows, cols)
+    puzzle.title = spec.get("title", "")
+    puzzle.author = spec.get("author", "")
+    puzzle.mark_black_squares(black_squares)
+    puzzle.initialize()
+    return GridSpec(puzzle_id, puzzle.to_ascii())
+
+
+class BatchFiller:
+    words_file: str
+    strategy: str
+    output_dir: str
+    output_format: str
+    num_workers: int
+    # budget of every grid's fill; None means unlimited
+    time_limit_seconds: Optional[float]
+    max_nodes: Optional[int]
+
+    def __init__(
+        self,
+        output_dir: str,
+        words_file: str = "wordlist.txt",
+        strategy: str = "csp",
+        output_format: str = "puz",
+        num_workers: Optional[int] = None,
+        time_limit_seconds: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+    ):
+        assert strategy in FILL_STRATEGIES, f"Unknown fill strategy {strategy}"
+        assert output_format in OUTPUT_FORMATS, f"Unknown output format {output_format}"
+        self.words_file = words_file
+        self.strategy = strategy
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.time_limit_seconds = time_limit_seconds
+        self.max_nodes = max_nodes
+
+    # Fills every grid and yields results in completion order, so callers
+    # can stream them out while the batch is still running.
+    def fill_all(self, specs: Iterable[GridSpec]) -> Iterator[BatchResult]:
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        load_worker_puzzle_filler(self.words_file)
+
+        tasks = (
+            (
+                spec,
+                self.strategy,
+                self.output_dir,
+                self.output_format,
+                self.time_limit_seconds,
+                self.max_nodes,
+            )
+            for spec in specs
+        )
+        with multiprocessing.Pool(
+            self.num_workers,
+            initializer=init_worker_puzzle_filler,
+            initargs=(self.words_file,),
+        ) as pool:
+            yield from pool.imap_unordered(_fill_grid, tasks)
+
+
+# Fills one grid and writes it out. A grid that raises becomes an error
+# result, so one bad grid doesn't abort the rest of the batch.
+def _fill_grid(
+    task: Tuple[GridSpec, str, str, str, Optional[float], Optional[int]]
+) -> BatchResult:
+    spec = task[0]
+    start_time = time.perf_counter()
+    error = spec.error
+    if error is None:
+        try:
+            return _fill_and_write_grid(task, start_time)
+        except Exception as e:
+            error = repr(e)
+    return BatchResult(
+        puzzle_id=spec.puzzle_id,
+        success=False,
+        status="error",
+        num_failed_entries=-1,
+        elapsed_seconds=time.perf_counter() - start_time,
+        output_file="",
+        error=error,
+    )
+
+
+def _fill_and_write_grid(
+    task: Tuple[GridSpec, str, str, str, Optional[float], Optional[int]],
+    start_time: float,
+) -> BatchResult:
+    spec, strategy, output_dir, output_format, time_limit_seconds, max_nodes = task
+    puzzle = Puzzle.from_ascii(spec.puzzle_ascii)
+    fill_result = get_worker_puzzle_filler().fill_puzzle_anytime(
+        puzzle,
+        strategy=strategy,
+        time_limit_seconds=time_limit_seconds,
+        max_nodes=max_nodes,
+    )
+
+    if output_format == "puz":
+        output_file = os.path.join(output_dir, spec.puzzle_id + ".puz")
+        puzzle.write_to_puz_file(output_file)
+    elif output_format == "archive":
+        archive_writer = _get_worker_archive_writer(output_dir)
+        archive_writer.write_puzzle(puzzle, spec.puzzle_id)
+        output_file = archive_writer.path
+    else:
+        output_file = os.path.join(output_dir, spec.puzzle_id + ".out")
+        puzzle.export_as_ascii(output_file)
+
+    return BatchResult(
+        puzzle_id=spec.puzzle_id,
+        success=fill_result.success,
+        status=fill_result.status,
+        num_failed_entries=fill_result.num_failed_entries,
+        elapsed_seconds=time.perf_counter() - start_time,
+        output_file=output_file,
+    )
+
+
+# Workers don't share an archive, so their writes can't interleave. Records
+# are written unbuffered, since pool workers exit without cleanup.
+def _get_worker_archive_writer(output_dir: str) -> ArchiveWriter:
+    global _worker_archive_writer
+    if _worker_archive_writer is None:
+        archive_path = os.path.join(output_dir, f"filled-{os.getpid()}{ARCHIVE_EXTENSION}")
+        _worker_archive_writer = ArchiveWriter(archive_path, buffering=0)
+    return _worker_archive_writer
+
+
+def result_to_json(result: BatchResult) -> str:
+    return json.dumps(asdict(result))
+
+
+# Puzzles per minute per worker, the batch throughput metric.
+def get_throughput(results: List[BatchResult], wall_seconds: float, num_workers: int) -> float:
+    if wall_seconds <= 0 or num_workers <= 0:
+        return 0.0
+    return len(results) / (wall_seconds / 60) / num_workers
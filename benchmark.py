@@ -0,0 +1,333 @@
+"""Reproducible benchmarks of fill strategies and dictionary operations."""
+import platform
+import random
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+from csp_solver import FillResult
+from puzzle import Puzzle
+from puzzle_filler import FILL_STRATEGIES, PuzzleFiller
+from word_filler import WordFiller
+
+# Bump whenever the corpus or what is measured changes, so results from
+# different versions aren't compared with each other.
+BENCHMARK_VERSION = 1
+
+# The layouts of main_fill_from_coordinates.py, as black squares that
+# Puzzle.mark_black_squares mirrors.
+_COORDINATE_GRIDS: Dict[str, Tuple[int, int, List[Tuple[int, int]]]] = {
+    "coordinates_1": (15, 15, [
+        (0, 8),
+        (1, 8),
+        (2, 8),
+        (3, 0), (3, 1), (3, 2), (3, 11),
+        (4, 5), (4, 10),
+        (5, 4), (5, 9), (5, 13), (5, 14),
+        (6, 3), (6, 14),
+        (7, 7),
+    ]),
+    "coordinates_2": (15, 15, [
+        (0, 4), (0, 9),
+        (1, 4), (1, 9),
+        (2, 4),
+        (3, 6), (3, 12), (3, 13), (3, 14),
+        (4, 11),
+        (5, 0), (5, 1), (5, 2), (5, 3), (5, 7), (5, 8),
+        (6, 0),
+        (7, 4), (7, 5), (7, 9), (7, 10)
+    ]),
+}
+
+# Standard rotationally symmetric grids, "#" for black squares.
+_LAYOUT_GRIDS: Dict[str, List[str]] = {
+    "15x15_1": [
+        "....#...#.....#",
+        "........#......",
+        "........#......",
+        ".....##....#...",
+        "...#......#....",
+        "#......#....###",
+        "....#....#.....",
+        ".....#...#.....",
+        ".....#....#....",
+        "###....#......#",
+        "....#......#...",
+        "...#....##.....",
+        "......#........",
+        "......#........",
+        "#.....#...#....",
+    ],
+    "15x15_2": [
+        ".......#...#...",
+        ".......#.......",
+        ".......#.......",
+        "#........##....",
+        "##...#.....#...",
+        "....#......####",
+        "........#......",
+        "......###......",
+        "......#........",
+        "####......#....",
+        "...#.....#...##",
+        "....##........#",
+        ".......#.......",
+        ".......#.......",
+        "...#...#.......",
+    ],
+    "21x21_1": [
+        "#........#...#...#...",
+        "#........#...#.......",
+        "#........#...........",
+        "......##....#.....###",
+        ".......#...#.........",
+        "...###....#..........",
+        "....#...#....#...#...",
+        "........##.....##....",
+        ".......#.......#.....",
+        "...#...#...##........",
+        "###...#...#...#...###",
+        "........##...#...#...",
+        ".....#.......#.......",
+        "....##.....##........",
+        "...#...#....#...#....",
+        "..........#....###...",
+        ".........#...#.......",
+        "###.....#....##......",
+        "...........#........#",
+        ".......#...#........#",
+        "...#...#...#........#",
+    ],
+    "21x21_2": [
+        "...#......##........#",
+        "...#......#..........",
+        "..........#..........",
+        ".....#......##...#...",
+        ".......#.....#...#...",
+        "###...##......##....#",
+        ".........##.......###",
+        "...#........#........",
+        "...#....#...#........",
+        "#...#......#...#.....",
+        "#.....##.....##.....#",
+        ".....#...#......#...#",
+        "........#...#....#...",
+        "........#........#...",
+        "###.......##.........",
+        "#....##......##...###",
+        "...#...#.....#.......",
+        "...#...##......#.....",
+        "..........#..........",
+        "..........#......#...",
+        "#........##......#...",
+    ],
+}
+
+BENCHMARK_GRIDS = sorted(list(_COORDINATE_GRIDS) + list(_LAYOUT_GRIDS))
+
+
+@dataclass
+class FillBenchmarkResult:
+    grid: str
+    strategy: str
+    seed: int
+    elapsed_seconds: float
+    # search nodes for csp, placements for the heuristic fill, loop
+    # iterations for backtracking
+    iterations: Optional[int]
+    # number of invalid entries per Puzzle.validate_puzzle
+    num_failed_entries: int
+    # the exception the fill raised, if any
+    error: Optional[str] = None
+
+
+@dataclass
+class DictionaryBenchmarkResult:
+    name: str
+    num_runs: int
+    # mean over the runs
+    seconds_per_run: float
+
+
+def build_grid(name: str) -> Puzzle:
+    if name in _COORDINATE_GRIDS:
+        rows, cols, coordinates = _COORDINATE_GRIDS[name]
+        puzzle = Puzzle(rows, cols)
+        puzzle.mark_black_squares(coordinates)
+    else:
+        layout = _LAYOUT_GRIDS[name]
+        puzzle = Puzzle(len(layout), len(layout[0]))
+        puzzle.mark_black_squares([
+            (r, c)
+            for r, row in enumerate(layout)
+            for c, square in enumerate(row)
+            if square == "#"
+        ])
+    puzzle.title = name
+    puzzle.initialize()
+    return puzzle
+
+
+# Runs every strategy on every grid once per seed.
+def run_fill_benchmarks(
+    words_file: str = "wordlist.txt",
+    grids: Optional[List[str]] = None,
+    strategies: Optional[List[str]] = None,
+    seeds: Optional[List[int]] = None,
+) -> List[FillBenchmarkResult]:
+    grids = grids or BENCHMARK_GRIDS
+    strategies = strategies or sorted(FILL_STRATEGIES)
+    seeds = seeds or [0, 1, 2]
+
+    results = []
+    for seed in seeds:
+        puzzle_filler = PuzzleFiller(words_file, seed=seed)
+        for grid in grids:
+            for strategy in strategies:
+                results.append(_run_fill(puzzle_filler, grid, strategy, seed))
+    return results
+
+
+def _run_fill(
+    puzzle_filler: PuzzleFiller,
+    grid: str,
+    strategy: str,
+    seed: int,
+) -> FillBenchmarkResult:
+    puzzle = build_grid(grid)
+    # start every fill from a cold pattern cache, so results don't depend
+    # on which fills ran before
+    puzzle_filler.word_filler.pattern_cache.clear()
+
+    error = None
+    fill_result = None
+    start_time = time.perf_counter()
+    try:
+        fill_result = FILL_STRATEGIES[strategy](puzzle_filler, puzzle)
+    except Exception as e:
+        error = repr(e)
+    elapsed_seconds = time.perf_counter() - start_time
+
+    num_failed_entries = len(puzzle.validate_puzzle(puzzle_filler.word_filler))
+
+    return FillBenchmarkResult(
+        grid=grid,
+        strategy=strategy,
+        seed=seed,
+        elapsed_seconds=elapsed_seconds,
+        iterations=_get_num_iterations(fill_result),
+        num_failed_entries=num_failed_entries,
+        error=error,
+    )
+
+
+# Normalizes what the FILL_STRATEGIES return to an iteration count.
+def _get_num_iterations(fill_result) -> Optional[int]:
+    if isinstance(fill_result, FillResult):
+        return fill_result.nodes
+    if isinstance(fill_result, tuple):
+        # (#entries filled, #entries failed)
+        return sum(fill_result)
+    if isinstance(fill_result, int):
+        return fill_result
+    return None
+
+
+# Builds hints the way a fill produces them: dictionary words with some of
+# their letters revealed.
+def generate_hints(word_filler: WordFiller, num_hints: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    lengths = [
+        length for length, size in word_filler.length_sizes.items()
+        if 3 <= length <= 15 and size > 0
+    ]
+    hints = []
+    for _ in range(num_hints):
+        length = rng.choice(lengths)
+        word = rng.choice(word_filler.words_by_length[length])
+        reveal_probability = rng.random()
+        hints.append("".join(
+            letter if rng.random() < reveal_probability else "."
+            for letter in word
+        ))
+    return hints
+
+
+def run_dictionary_benchmarks(
+    words_file: str = "wordlist.txt",
+    num_load_runs: int = 3,
+    num_hints: int = 2000,
+    seed: int = 0,
+) -> List[DictionaryBenchmarkResult]:
+    results = []
+
+    # loading from the word list itself, as on a cache miss
+    start_time = time.perf_counter()
+    for _ in range(num_load_runs):
+        WordFiller(words_file, use_cache=False)
+    results.append(DictionaryBenchmarkResult(
+        "load_uncached",
+        num_load_runs,
+        (time.perf_counter() - start_time) / num_load_runs,
+    ))
+
+    # loading from the compiled cache, compiled by the first load
+    WordFiller(words_file)
+    start_time = time.perf_counter()
+    for _ in range(num_load_runs):
+        WordFiller(words_file)
+    results.append(DictionaryBenchmarkResult(
+        "load_cached",
+        num_load_runs,
+        (time.perf_counter() - start_time) / num_load_runs,
+    ))
+
+    word_filler = WordFiller(words_file, seed=seed)
+    hints = generate_hints(word_filler, num_hints, seed)
+    # decode every length bucket the hints touch, so the timings below
+    # don't include decoding
+    for hint in hints:
+        word_filler.letter_index[len(hint)]
+        word_filler.words_by_length[len(hint)]
+
+    word_filler.pattern_cache.clear()
+    start_time = time.perf_counter()
+    for hint in hints:
+        word_filler.get_possible_words_for_hint(hint)
+    results.append(DictionaryBenchmarkResult(
+        "get_possible_words_for_hint_cold",
+        len(hints),
+        (time.perf_counter() - start_time) / len(hints),
+    ))
+
+    # the same hints again, now answered by the pattern cache
+    start_time = time.perf_counter()
+    for hint in hints:
+        word_filler.get_possible_words_for_hint(hint)
+    results.append(DictionaryBenchmarkResult(
+        "get_possible_words_for_hint_warm",
+        len(hints),
+        (time.perf_counter() - start_time) / len(hints),
+    ))
+    return results
+
+
+def get_environment() -> Dict[str, str]:
+    return {
+        "benchmark_version": str(BENCHMARK_VERSION),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+
+def results_to_dict(
+    fill_results: List[FillBenchmarkResult],
+    dictionary_results: List[DictionaryBenchmarkResult],
+) -> Dict:
+    return {
+        "environment": get_environment(),
+        "fill": [asdict(result) for result in fill_results],
+        "dictionary": [asdict(result) for result in dictionary_results],
+    }
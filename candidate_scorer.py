@@ -0,0 +1,255 @@
+"""Scores an entry's candidate answers by the room they leave its crossings."""
+import math
+import warnings
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from entry import Entry
+from puzzle import Puzzle
+from word_filler import WordFiller
+
+# NumPy is in requirements.txt. Without it, candidates are scored one at a
+# time in plain Python, with the same scores up to float rounding but many
+# times slower, so the fallback is announced.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+    warnings.warn(
+        "numpy is not installed; candidates will be scored one at a time in plain Python",
+        RuntimeWarning,
+    )
+
+
+class ScoreFunction:
+    # 0.8 * smallest crossing domain + 0.2 * second smallest
+    BLEND = "blend"
+    # smallest crossing domain
+    MIN = "min"
+    # product of the crossing domain sizes, as a sum of logs
+    LOG_PRODUCT = "log_product"
+
+
+@dataclass
+class ScoredCandidate:
+    answer: str
+    score: float
+    # False if placing the answer leaves some crossing entry without any
+    # candidates (at any level of the lookahead)
+    is_viable: bool
+
+
+# Scores candidates for an entry of a puzzle whose domains are tracked
+# (Puzzle.init_domains). Puzzles that don't track them yet start tracking
+# them, with used words excluded, on their first scoring.
+#
+# At depth 1, a candidate is scored from the domain sizes its letters leave
+# the open crossing entries with. Those sizes only depend on the letter
+# placed at each crossing, so each crossing contributes one letter
+# histogram of its domain, and all candidates are scored at once by
+# indexing the histograms with the candidates' letter matrix.
+#
+# At depth d > 1, each of the `width` best depth-1 candidates is placed on
+# trial, every open crossing entry is scored at depth d - 1, and the
+# candidate keeps the score of its worst crossing.
+class CandidateScorer:
+    word_filler: WordFiller
+    # how many candidates to score; None scores the entry's whole domain
+    width: Optional[int]
+    depth: int
+    score_function: str
+
+    def __init__(
+        self,
+        word_filler: WordFiller,
+        width: Optional[int] = 30,
+        depth: int = 1,
+        score_function: str = ScoreFunction.BLEND,
+    ):
+        assert depth >= 1, "Lookahead depth must be at least 1"
+        self.word_filler = word_filler
+        self.width = width
+        self.depth = depth
+        self.score_function = score_function
+
+    # Returns the entry's candidates, best first. Ties keep candidate order.
+    def score_candidates(self, puzzle: Puzzle, entry: Entry) -> List[ScoredCandidate]:
+        # without domains every candidate list would come back empty
+        if puzzle.domain_word_filler is None:
+            puzzle.init_domains(self.word_filler)
+        return self._score(puzzle, entry, self.depth)
+
+    def _score(self, puzzle: Puzzle, entry: Entry, depth: int) -> List[ScoredCandidate]:
+        candidates = self.word_filler.get_words_for_mask(
+            entry.answer_length,
+            entry.domain,
+            limit=self.width,
+        )
+        if not candidates:
+            return []
+
+        scored_candidates = self._score_depth_one(puzzle, entry, candidates)
+        if depth == 1:
+            return scored_candidates
+
+        # candidates that already fail at depth 1 keep their score, and
+        # sort last like every other non-viable candidate
+        deeper_scored_candidates = [
+            self._score_with_lookahead(puzzle, entry, candidate, depth)
+            if candidate.is_viable else candidate
+            for candidate in scored_candidates
+        ]
+        deeper_scored_candidates.sort(
+            key=lambda candidate: candidate.score,
+            reverse=True,
+        )
+        return deeper_scored_candidates
+
+    def _score_with_lookahead(
+        self,
+        puzzle: Puzzle,
+        entry: Entry,
+        candidate: ScoredCandidate,
+        depth: int,
+    ) -> ScoredCandidate:
+        open_crossings = self._get_open_crossings(puzzle, entry)
+        checkpoint_id = puzzle.checkpoint()
+        puzzle.place_answer(entry, candidate.answer)
+
+        score = math.inf
+        for _, crossing_entry, _ in open_crossings:
+            if crossing_entry.is_complete():
+                continue
+            crossing_candidates = self._score(puzzle, crossing_entry, depth - 1)
+            viable_scores = [c.score for c in crossing_candidates if c.is_viable]
+            if not viable_scores:
+                score = None
+                break
+            score = min(score, max(viable_scores))
+
+        puzzle.rollback(checkpoint_id)
+        if score is None:
+            return ScoredCandidate(candidate.answer, min(candidate.score, 0), False)
+        if score == math.inf:
+            score = candidate.score
+        return ScoredCandidate(candidate.answer, score, True)
+
+    def _score_depth_one(
+        self,
+        puzzle: Puzzle,
+        entry: Entry,
+        candidates: List[str],
+    ) -> List[ScoredCandidate]:
+        open_crossings = self._get_open_crossings(puzzle, entry)
+        histograms = [
+            self._get_letter_histogram(crossing_entry, crossing_position)
+            for _, crossing_entry, crossing_position in open_crossings
+        ]
+        positions = [position for position, _, _ in open_crossings]
+
+        if np is not None:
+            scores, min_counts = self._score_vectorized(candidates, positions, histograms)
+        else:
+            scores, min_counts = self._score_one_by_one(candidates, positions, histograms)
+
+        scored_candidates = [
+            ScoredCandidate(answer, score, min_count > 0)
+            for answer, score, min_count in zip(candidates, scores, min_counts)
+        ]
+        # list.sort is stable, so ties keep candidate order
+        scored_candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+        return scored_candidates
+
+    # Returns (position in entry, crossing entry, position in crossing
+    # entry) for the entry's empty squares.
+    @staticmethod
+    def _get_open_crossings(puzzle: Puzzle, entry: Entry) -> List[Tuple[int, Entry, int]]:
+        hint = entry.get_current_hint()
+        return [
+            (position, crossing_entry, crossing_position)
+            for position, crossing_entry, crossing_position in puzzle.get_crossings(entry)
+            if hint[position] == "."
+        ]
+
+    # letter code point -> size of the crossing entry's domain after placing
+    # that letter at the crossing position
+    def _get_letter_histogram(self, crossing_entry: Entry, crossing_position: int) -> Dict[int, int]:
+        if crossing_entry.answer_length not in self.word_filler.letter_index:
+            return {}
+        letter_masks = self.word_filler.letter_index[crossing_entry.answer_length][crossing_position]
+        return {
+            ord(letter): (crossing_entry.domain & letter_mask).bit_count()
+            for letter, letter_mask in letter_masks.items()
+        }
+
+    def _score_vectorized(
+        self,
+        candidates: List[str],
+        positions: List[int],
+        histograms: List[Dict[int, int]],
+    ):
+        num_candidates = len(candidates)
+        if not positions:
+            return [999] * num_candidates, [1] * num_candidates
+
+        letter_matrix = np.frombuffer(
+            "".join(candidates).encode("latin-1"),
+            dtype=np.uint8,
+        ).reshape(num_candidates, -1)
+
+        # counts[i, j]: crossing j's domain size if candidate i is placed
+        counts = np.empty((num_candidates, len(positions)), dtype=np.int64)
+        for j, (position, histogram) in enumerate(zip(positions, histograms)):
+            histogram_array = np.zeros(256, dtype=np.int64)
+            histogram_array[list(histogram.keys())] = list(histogram.values())
+            counts[:, j] = histogram_array[letter_matrix[:, position]]
+
+        min_counts = counts.min(axis=1)
+        if self.score_function == ScoreFunction.MIN:
+            scores = min_counts
+        elif self.score_function == ScoreFunction.LOG_PRODUCT:
+            with np.errstate(divide="ignore"):
+                scores = np.log(counts).sum(axis=1)
+        elif counts.shape[1] == 1:
+            scores = counts[:, 0]
+        else:
+            smallest_two = np.sort(counts, axis=1)[:, :2]
+            scores = np.where(
+                smallest_two[:, 0] == 0,
+                0.0,
+                smallest_two[:, 0] * 0.8 + smallest_two[:, 1] * 0.2,
+            )
+        return scores.tolist(), min_counts.tolist()
+
+    def _score_one_by_one(
+        self,
+        candidates: List[str],
+        positions: List[int],
+        histograms: List[Dict[int, int]],
+    ):
+        scores = []
+        min_counts = []
+        for answer in candidates:
+            counts = [
+                histogram.get(ord(answer[position]), 0)
+                for position, histogram in zip(positions, histograms)
+            ]
+            num_matches = sorted(counts)
+            min_counts.append(num_matches[0] if num_matches else 1)
+
+            if len(num_matches) == 0:
+                scores.append(999)
+            elif self.score_function == ScoreFunction.MIN:
+                scores.append(num_matches[0])
+            elif self.score_function == ScoreFunction.LOG_PRODUCT:
+                scores.append(
+                    -math.inf if num_matches[0] == 0
+                    else sum(math.log(n) for n in counts)
+                )
+            elif len(num_matches) == 1:
+                scores.append(num_matches[0])
+            elif num_matches[0] == 0:
+                scores.append(0)
+            else:
+                scores.append(num_matches[0]*0.8 + num_matches[1]*0.2)
+        return scores, min_counts
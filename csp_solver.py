@@ -0,0 +1,395 @@
+"""Depth-first constraint solver for filling a crossword grid."""
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from entry import Entry
+from fill_budget import FillBudget
+from puzzle import Puzzle
+from word_filler import WordFiller
+
+
+class Propagation:
+    FORWARD_CHECKING = "forward_checking"
+    AC3 = "ac3"
+
+
+@dataclass
+class FillResult:
+    success: bool
+    # "solved", "unsatisfiable", "node_budget" or "deadline", or
+    # "incomplete" for a greedy fill that ran out of candidates
+    status: str
+    # index_str -> answer for every entry the solver filled in
+    answers: Dict[str, str] = field(default_factory=dict)
+    nodes: int = 0
+    backtracks: int = 0
+    backjumps: int = 0
+    elapsed_seconds: float = 0.0
+    # invalid entries per Puzzle.validate_puzzle, where computed
+    num_failed_entries: Optional[int] = None
+
+
+# A solver variable is an incomplete entry of the puzzle. Entries that are
+# already complete only show up through the letters they pin in their
+# crossing entries' hints.
+#
+# The search assigns variables in minimum-remaining-values order, narrows
+# the domains of crossing variables after every assignment (forward
+# checking, optionally followed by AC-3), and on failure jumps straight
+# back to the most recent assignment that contributed to the conflict.
+# Unless duplicate answers are allowed, every assignment also takes its
+# word out of the domains of the other variables of the same length.
+class CSPSolver:
+    word_filler: WordFiller
+    propagation: str
+    # how many candidates of a variable are ordered by how much room they
+    # leave their crossing entries; the rest are tried in dictionary order.
+    num_scored_candidates: int
+    # wall-clock and node budget, checked on every node
+    budget: Optional[FillBudget]
+    # whether a search that stops without a complete fill still fills in
+    # the most variables it ever had assigned at once
+    keep_partial_fill: bool
+    allow_duplicate_answers: bool
+
+    def __init__(
+        self,
+        word_filler: WordFiller,
+        propagation: str = Propagation.AC3,
+        num_scored_candidates: int = 50,
+        budget: Optional[FillBudget] = None,
+        keep_partial_fill: bool = False,
+        allow_duplicate_answers: bool = False,
+    ):
+        self.word_filler = word_filler
+        self.propagation = propagation
+        self.num_scored_candidates = num_scored_candidates
+        self.budget = budget
+        self.keep_partial_fill = keep_partial_fill
+        self.allow_duplicate_answers = allow_duplicate_answers
+
+    # Makes the domains of the puzzle's incomplete entries arc consistent
+    # without searching or modifying the puzzle, leaving them in
+    # self.domains. Returns an entry left without candidates, which proves
+    # the puzzle can't be filled, or None.
+    def propagate(self, puzzle: Puzzle) -> Optional[Entry]:
+        self._setup(puzzle, None, None)
+        for var, domain in enumerate(self.domains):
+            if domain == 0:
+                return self.variables[var]
+        wiped_out_var = self._run_ac3(list(range(len(self.variables))))
+        return None if wiped_out_var is None else self.variables[wiped_out_var]
+
+    # Fills the incomplete entries of the puzzle, or just those among the
+    # given entries. Unless keep_partial_fill is set, the puzzle is only
+    # modified if a complete fill is found. Entries in previous_answers
+    # (index_str -> answer) try that answer last, so that a re-fill comes
+    # out different wherever it can.
+    def solve(
+        self,
+        puzzle: Puzzle,
+        entries: Optional[List[Entry]] = None,
+        previous_answers: Optional[Dict[str, str]] = None,
+    ) -> FillResult:
+        start_time = time.perf_counter()
+        self._setup(puzzle, entries, previous_answers)
+        result = FillResult(success=False, status="unsatisfiable")
+        self.result = result
+
+        if not any(domain == 0 for domain in self.domains):
+            try:
+                if self.propagation != Propagation.AC3 or \
+                        self._run_ac3(list(range(len(self.variables)))) is None:
+                    if self._search() is None:
+                        result.success = True
+                        result.status = "solved"
+            except _BudgetExceeded as e:
+                result.status = e.status
+
+        if result.success:
+            assignment = list(enumerate(self.domains))
+        elif self.keep_partial_fill:
+            assignment = self.best_assignment
+        else:
+            assignment = []
+        for var, domain in assignment:
+            entry = self.variables[var]
+            answer = self.word_filler.get_words_for_mask(
+                entry.answer_length,
+                domain,
+                limit=1,
+            )[0]
+            result.answers[entry.index_str()] = answer
+            puzzle.fill_entry(entry, answer)
+
+        result.elapsed_seconds = time.perf_counter() - start_time
+        return result
+
+    def _setup(
+        self,
+        puzzle: Puzzle,
+        entries: Optional[List[Entry]],
+        previous_answers: Optional[Dict[str, str]],
+    ) -> None:
+        if entries is None:
+            entries = puzzle.entry_list
+        self.variables: List[Entry] = [
+            entry for entry in entries if not entry.is_complete()
+        ]
+        # Entry.id -> variable
+        var_ids = {entry.id: i for i, entry in enumerate(self.variables)}
+
+        # length -> bitset of the answers of the entries that are already
+        # complete, which no variable may take
+        used_masks: Dict[int, int] = {}
+        if not self.allow_duplicate_answers:
+            for entry in puzzle.entries.values():
+                if entry.is_complete():
+                    used_masks[entry.answer_length] = used_masks.get(entry.answer_length, 0) | \
+                        self.word_filler.get_mask_for_hint(entry.get_current_hint())
+        self.domains: List[int] = [
+            self.word_filler.get_mask_for_hint(
+                entry.get_current_hint(),
+                exclude_mask=used_masks.get(entry.answer_length, 0),
+            )
+            for entry in self.variables
+        ]
+        # the word id each variable tries last, if any
+        self.last_word_ids: List[Optional[int]] = [None] * len(self.variables)
+        for var, entry in enumerate(self.variables):
+            previous_answer = (previous_answers or {}).get(entry.index_str())
+            if previous_answer is None or len(previous_answer) != entry.answer_length:
+                continue
+            word_mask = self.word_filler.get_mask_for_hint(previous_answer)
+            if word_mask:
+                self.last_word_ids[var] = word_mask.bit_length() - 1
+        # answer length -> variables of that length
+        self.vars_by_length: Dict[int, List[int]] = {}
+        for var, entry in enumerate(self.variables):
+            self.vars_by_length.setdefault(entry.answer_length, []).append(var)
+        # position -> letter -> bitset, per variable
+        self.letter_masks: List[List[Dict[str, int]]] = [
+            self.word_filler.letter_index.get(entry.answer_length, [])
+            for entry in self.variables
+        ]
+        # (position in var, crossing var, position in crossing var), from the
+        # puzzle's crossing graph
+        self.neighbors: List[List[Tuple[int, int, int]]] = []
+        for entry in self.variables:
+            hint = entry.get_current_hint()
+            self.neighbors.append([
+                (position, var_ids[crossing.id], crossing_position)
+                for position, crossing, crossing_position in puzzle.get_crossings(entry)
+                if hint[position] == "." and crossing.id in var_ids
+            ])
+
+        # the assigned variables that narrowed each variable's domain,
+        # directly or through propagation
+        self.pruned_by: List[FrozenSet[int]] = [frozenset()] * len(self.variables)
+        self.assigned: List[bool] = [False] * len(self.variables)
+        self.num_assigned = 0
+        # (var, single-word domain) of the most variables assigned at once
+        self.best_assignment: List[Tuple[int, int]] = []
+        self.trail: List[Tuple[int, int, FrozenSet[int]]] = []
+
+    # Returns None once every variable is assigned, or the conflict set of
+    # the failed subtree: the assigned variables responsible for the failure.
+    def _search(self) -> Optional[FrozenSet[int]]:
+        var = self._select_variable()
+        if var is None:
+            return None
+
+        conflict_set = set()
+        for word_id in self._order_values(var):
+            self.result.nodes += 1
+            if self.budget is not None and not self.budget.spend_node(self.num_assigned):
+                raise _BudgetExceeded(self.budget.exhausted_reason)
+
+            trail_mark = len(self.trail)
+            wiped_out_var = self._assign(var, word_id)
+            if wiped_out_var is None:
+                if self.num_assigned > len(self.best_assignment):
+                    self.best_assignment = [
+                        (assigned_var, self.domains[assigned_var])
+                        for assigned_var, assigned in enumerate(self.assigned)
+                        if assigned
+                    ]
+                sub_conflict_set = self._search()
+                if sub_conflict_set is None:
+                    return None
+                if var not in sub_conflict_set:
+                    # nothing this variable can take fixes the failure below
+                    self.result.backjumps += 1
+                    self._unassign(var, trail_mark)
+                    return sub_conflict_set
+                conflict_set |= sub_conflict_set
+            else:
+                conflict_set |= self.pruned_by[wiped_out_var]
+
+            self._unassign(var, trail_mark)
+
+        self.result.backtracks += 1
+        conflict_set |= self.pruned_by[var]
+        conflict_set.discard(var)
+        return frozenset(conflict_set)
+
+    # Picks the unassigned variable with the smallest domain, breaking ties
+    # by the number of unassigned crossing variables.
+    def _select_variable(self) -> Optional[int]:
+        best_var = None
+        best_key = None
+        for var, domain in enumerate(self.domains):
+            if self.assigned[var]:
+                continue
+            degree = sum(
+                1 for _, neighbor, _ in self.neighbors[var]
+                if not self.assigned[neighbor]
+            )
+            key = (domain.bit_count(), -degree)
+            if best_key is None or key < best_key:
+                best_var, best_key = var, key
+        return best_var
+
+    # Yields the word ids of the variable's domain. The first
+    # num_scored_candidates come in order of the smallest crossing domain
+    # they leave behind; the rest follow in dictionary order, and the
+    # variable's last word id, if in its domain, comes at the very end.
+    def _order_values(self, var: int):
+        domain = self.domains[var]
+        last_word_id = self.last_word_ids[var]
+        if last_word_id is not None and domain >> last_word_id & 1:
+            domain &= ~(1 << last_word_id)
+        else:
+            last_word_id = None
+        words = self.word_filler.words_by_length[self.variables[var].answer_length]
+        open_neighbors = [
+            (position, neighbor, neighbor_position)
+            for position, neighbor, neighbor_position in self.neighbors[var]
+            if not self.assigned[neighbor]
+        ]
+
+        candidate_ids = self.word_filler.iter_word_ids(
+            self.variables[var].answer_length,
+            domain,
+        )
+        scored_candidates = []
+        for word_id in candidate_ids:
+            word = words[word_id]
+            score = min(
+                (
+                    (self.domains[neighbor] & self.letter_masks[neighbor][
+                        neighbor_position].get(word[position], 0)).bit_count()
+                    for position, neighbor, neighbor_position in open_neighbors
+                ),
+                default=1,
+            )
+            scored_candidates.append((score, word_id))
+            if len(scored_candidates) >= self.num_scored_candidates:
+                break
+        scored_candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        for _, word_id in scored_candidates:
+            yield word_id
+        # the rest of the candidates, in candidate order
+        yield from candidate_ids
+        if last_word_id is not None:
+            yield last_word_id
+
+    # Assigns the word to the variable and propagates. Returns the variable
+    # whose domain was wiped out, or None if propagation succeeded.
+    def _assign(self, var: int, word_id: int) -> Optional[int]:
+        self.assigned[var] = True
+        self.num_assigned += 1
+        self._set_domain(var, 1 << word_id, self.pruned_by[var])
+
+        word = self.word_filler.words_by_length[
+            self.variables[var].answer_length][word_id]
+        culprits = frozenset((var,))
+        changed_vars = []
+        for position, neighbor, neighbor_position in self.neighbors[var]:
+            if self.assigned[neighbor]:
+                continue
+            domain = self.domains[neighbor]
+            narrowed_domain = domain & self.letter_masks[neighbor][
+                neighbor_position].get(word[position], 0)
+            if narrowed_domain == domain:
+                continue
+            self._set_domain(
+                neighbor,
+                narrowed_domain,
+                self.pruned_by[neighbor] | culprits,
+            )
+            if narrowed_domain == 0:
+                return neighbor
+            changed_vars.append(neighbor)
+
+        if not self.allow_duplicate_answers:
+            word_mask = 1 << word_id
+            for other_var in self.vars_by_length[self.variables[var].answer_length]:
+                domain = self.domains[other_var]
+                if self.assigned[other_var] or not domain & word_mask:
+                    continue
+                self._set_domain(
+                    other_var,
+                    domain & ~word_mask,
+                    self.pruned_by[other_var] | culprits,
+                )
+                if domain == word_mask:
+                    return other_var
+                changed_vars.append(other_var)
+
+        if self.propagation == Propagation.AC3 and changed_vars:
+            return self._run_ac3(changed_vars)
+        return None
+
+    # Makes the domains of unassigned variables arc consistent with the
+    # domains in the queue. Returns a wiped out variable, or None.
+    def _run_ac3(self, queue: List[int]) -> Optional[int]:
+        queued = set(queue)
+        while queue:
+            var = queue.pop()
+            queued.discard(var)
+            domain = self.domains[var]
+            for position, neighbor, neighbor_position in self.neighbors[var]:
+                if self.assigned[neighbor]:
+                    continue
+                neighbor_masks = self.letter_masks[neighbor][neighbor_position]
+                support = 0
+                for letter, letter_mask in self.letter_masks[var][position].items():
+                    if domain & letter_mask:
+                        support |= neighbor_masks.get(letter, 0)
+                neighbor_domain = self.domains[neighbor]
+                narrowed_domain = neighbor_domain & support
+                if narrowed_domain == neighbor_domain:
+                    continue
+                self._set_domain(
+                    neighbor,
+                    narrowed_domain,
+                    self.pruned_by[neighbor] | self.pruned_by[var],
+                )
+                if narrowed_domain == 0:
+                    return neighbor
+                if neighbor not in queued:
+                    queued.add(neighbor)
+                    queue.append(neighbor)
+        return None
+
+    def _set_domain(self, var: int, domain: int, pruned_by: FrozenSet[int]) -> None:
+        self.trail.append((var, self.domains[var], self.pruned_by[var]))
+        self.domains[var] = domain
+        self.pruned_by[var] = pruned_by
+
+    def _unassign(self, var: int, trail_mark: int) -> None:
+        while len(self.trail) > trail_mark:
+            trailed_var, domain, pruned_by = self.trail.pop()
+            self.domains[trailed_var] = domain
+            self.pruned_by[trailed_var] = pruned_by
+        self.assigned[var] = False
+        self.num_assigned -= 1
+
+
+class _BudgetExceeded(Exception):
+    def __init__(self, status: str):
+        super().__init__(status)
+        self.status = status
@@ -1,10 +1,10 @@
 """Class representing a crossword clue."""
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, Tuple, List, Dict
+from typing import Dict, Optional, Tuple, List
 
 from word_filler import WordFiller
-from square import Square
+from square import EMPTY_LETTER, Square
 
 
 class Direction(Enum):
@@ -12,7 +12,7 @@ class Direction(Enum):
     DOWN = 'D'
 
 
-@dataclass
+@dataclass(slots=True)
 class Entry:
     index: int
     direction: Direction
@@ -21,39 +21,90 @@ class Entry:
     answer_length: int
     clue: Optional[str] = None
     squares: List[Square] = None
-    cached_num_matches: Dict[str, int] = field(default_factory=dict)
+    # Live candidate domain: a bitset over the WordFiller words of this
+    # entry's length, kept in sync with the grid once the puzzle's domains
+    # are initialized. None means domains are not being tracked.
+    domain: Optional[int] = None
+    # Position of the entry in its puzzle's flat arrays, set by
+    # Puzzle.initialize. id indexes Puzzle.entry_list, and the entry's
+    # letters are grid_letters[start_cell::cell_step], answer_length long.
+    id: int = -1
+    grid_letters: Optional[bytearray] = field(default=None, repr=False, compare=False)
+    start_cell: int = 0
+    cell_step: int = 1
+    # crossing entry id -> (position in this entry, position in the
+    # crossing entry), set by Puzzle.initialize
+    crossings: Optional[Dict[int, Tuple[int, int]]] = field(default=None, repr=False, compare=False)
 
     # returns True if the current entry shares any squares
     # with the passed-in Entry, false otherwise.
     def intersects_with(self, entry: 'Entry') -> bool:
-        common_squares = set(self._get_square_indices()).\
-            intersection(set(entry._get_square_indices()))
-        if len(common_squares) == 0:
-            print(f"{entry.index_str()} does not intersect with {self.index_str()}")
-        return len(common_squares) > 0
+        if self.crossings is not None:
+            return entry.id == self.id or entry.id in self.crossings
+
+        # entries outside an initialized puzzle: compare their extents
+        if self.direction == entry.direction:
+            if self.direction == Direction.ACROSS:
+                return self.row_in_grid == entry.row_in_grid and \
+                    _ranges_overlap(self.col_in_grid, self.answer_length,
+                                    entry.col_in_grid, entry.answer_length)
+            return self.col_in_grid == entry.col_in_grid and \
+                _ranges_overlap(self.row_in_grid, self.answer_length,
+                                entry.row_in_grid, entry.answer_length)
+
+        across, down = (self, entry) if self.direction == Direction.ACROSS else (entry, self)
+        return across.col_in_grid <= down.col_in_grid < across.col_in_grid + across.answer_length \
+            and down.row_in_grid <= across.row_in_grid < down.row_in_grid + down.answer_length
 
     def get_current_hint(self) -> str:
+        if self.grid_letters is not None:
+            return self.get_hint_bytes().decode("latin-1")
+
         current_hint = ""
         for sq in self.squares:
             current_hint += sq.letter if sq.letter is not None else "."
         return current_hint
 
+    # The entry's letters straight out of the grid, "." for empty squares.
+    def get_hint_bytes(self) -> bytes:
+        return bytes(self.grid_letters[self.start_cell:self.get_end_cell():self.cell_step])
+
+    def get_end_cell(self) -> int:
+        return self.start_cell + (self.answer_length - 1) * self.cell_step + 1
+
+    def get_cells(self) -> range:
+        return range(self.start_cell, self.get_end_cell(), self.cell_step)
+
     def is_complete(self) -> bool:
+        if self.grid_letters is not None:
+            return EMPTY_LETTER not in self.get_hint_bytes()
+
         for sq in self.squares:
             if sq.letter is None:
                 return False
         return True
 
     def get_possible_matches(self, word_filler: WordFiller) -> List[str]:
+        if word_filler.tracer.enabled:
+            word_filler.tracer.count("entry_match_queries")
+        if self.domain is not None:
+            return word_filler.get_words_for_mask(
+                self.answer_length,
+                self.domain,
+                limit=2000,
+            )
         current_hint = self.get_current_hint()
         return word_filler.get_possible_words_for_hint(current_hint)
 
-    def get_num_possible_matches(self, word_filler: WordFiller):
-        current_hint = self.get_current_hint()
-        if current_hint not in self.cached_num_matches:
-            self.cached_num_matches[current_hint] = len(self.get_possible_matches(word_filler))
+    # Unlike get_possible_matches, the count is exact rather than capped.
+    def get_num_possible_matches(self, word_filler: WordFiller) -> int:
+        if word_filler.tracer.enabled:
+            word_filler.tracer.count("entry_count_queries")
+        if self.domain is not None:
+            return self.domain.bit_count()
 
-        return self.cached_num_matches[current_hint]
+        # hints are looked up in the word filler's shared pattern cache
+        return word_filler.count_words_for_hint(self.get_current_hint())
 
     # Uses a heuristic to determine the priority of the given entry during
     # puzzle filling.
@@ -70,19 +121,6 @@ class Entry:
 
         return max(0, 300 - num_possible_matches*10) + self.answer_length
 
-    def _get_square_indices(self) -> List[Tuple[int, int]]:
-        r = self.row_in_grid
-        c = self.col_in_grid
-        square_indices = []
-        if self.direction == Direction.ACROSS:
-            for i in range(self.answer_length):
-                square_indices.append((r, c + i))
-        else:
-            for i in range(self.answer_length):
-                square_indices.append((r + i, c))
-
-        return square_indices
-
     def index_str(self) -> str:
         return f"{self.index}{self.direction.value}"
 
@@ -104,4 +142,8 @@ class Entry:
         return components[0]
 
     def __hash__(self) -> int:
-        return hash(self.index_str())
\ No newline at end of file
+        return hash(self.index_str())
+
+
+def _ranges_overlap(start: int, length: int, other_start: int, other_length: int) -> bool:
+    return start < other_start + other_length and other_start < start + length
@@ -0,0 +1,57 @@
+"""Indexed max-priority queue of entries, keyed by entry."""
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from entry import Entry
+
+
+# Entries with the highest priority come out first; ties go to the entry
+# that came first in the iterable the queue was built from, which matches
+# a stable sort of the entries by descending priority.
+#
+# Updating an entry pushes a fresh heap item and leaves the old one behind
+# to be skipped when it surfaces, so an update costs O(log n) instead of
+# re-sorting every entry.
+class EntryPriorityQueue:
+    heap: List[Tuple[int, int, str]]
+    # index_str -> current priority of the entries in the queue
+    priorities: Dict[str, int]
+    order: Dict[str, int]
+    entries: Dict[str, Entry]
+
+    def __init__(self, entries: Iterable[Entry]):
+        self.heap = []
+        self.priorities = {}
+        self.order = {}
+        self.entries = {}
+        for i, entry in enumerate(entries):
+            self.order[entry.index_str()] = i
+            self.entries[entry.index_str()] = entry
+
+    # Sets the entry's priority. Entries with a priority of 0 or less are
+    # removed from the queue.
+    def update(self, entry: Entry, priority: int) -> None:
+        index_str = entry.index_str()
+        if priority <= 0:
+            self.priorities.pop(index_str, None)
+            return
+        if self.priorities.get(index_str) == priority:
+            return
+        self.priorities[index_str] = priority
+        heapq.heappush(self.heap, (-priority, self.order[index_str], index_str))
+
+    def remove(self, entry: Entry) -> None:
+        self.priorities.pop(entry.index_str(), None)
+
+    # Returns the entry with the highest priority without removing it.
+    def peek(self) -> Optional[Entry]:
+        while self.heap:
+            neg_priority, _, index_str = self.heap[0]
+            if self.priorities.get(index_str) == -neg_priority:
+                return self.entries[index_str]
+            # stale item left behind by an update or removal
+            heapq.heappop(self.heap)
+        return None
+
+    def __len__(self) -> int:
+        return len(self.priorities)
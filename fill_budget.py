@@ -0,0 +1,91 @@
+"""Wall-clock and node budgets, with progress reports, for anytime fills."""
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+@dataclass
+class FillProgress:
+    nodes: int
+    elapsed_seconds: float
+    # entries filled in the current search state
+    num_filled_entries: int
+    # the most entries filled in any search state so far
+    best_num_filled_entries: int
+
+
+# Shared by the fill strategies: every node (an answer placed or tried)
+# is charged to the budget, which says when to stop. Every
+# progress_interval nodes it calls progress_callback, and stops the fill
+# if cancel_check returns True.
+class FillBudget:
+    time_limit_seconds: Optional[float]
+    max_nodes: Optional[int]
+    progress_callback: Optional[Callable[[FillProgress], None]]
+    progress_interval: int
+    cancel_check: Optional[Callable[[], bool]]
+    nodes: int
+    # None while within budget, then "deadline", "node_budget" or
+    # "cancelled"
+    exhausted_reason: Optional[str]
+
+    def __init__(
+        self,
+        time_limit_seconds: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+        progress_callback: Optional[Callable[[FillProgress], None]] = None,
+        progress_interval: int = 100,
+        cancel_check: Optional[Callable[[], bool]] = None,
+    ):
+        assert progress_interval >= 1, "The progress interval must be at least 1 node"
+        self.time_limit_seconds = time_limit_seconds
+        self.max_nodes = max_nodes
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.cancel_check = cancel_check
+        self.start()
+
+    # Restarts the clock and the node count.
+    def start(self) -> None:
+        self.start_time = time.perf_counter()
+        self.deadline = None if self.time_limit_seconds is None \
+            else self.start_time + self.time_limit_seconds
+        self.nodes = 0
+        self.best_num_filled_entries = 0
+        self.exhausted_reason = None
+
+    # Whether the budget runs out by itself, without being cancelled.
+    def is_bounded(self) -> bool:
+        return self.time_limit_seconds is not None or self.max_nodes is not None
+
+    # Charges one node. Returns False once the budget is used up, in which
+    # case the node should not be explored.
+    def spend_node(self, num_filled_entries: int) -> bool:
+        self.nodes += 1
+        self.best_num_filled_entries = max(self.best_num_filled_entries, num_filled_entries)
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            self.exhausted_reason = "node_budget"
+            return False
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            self.exhausted_reason = "deadline"
+            return False
+        if self.nodes % self.progress_interval == 0:
+            if self.cancel_check is not None and self.cancel_check():
+                self.exhausted_reason = "cancelled"
+                return False
+            self.report_progress(num_filled_entries)
+        return True
+
+    def report_progress(self, num_filled_entries: int) -> None:
+        if self.progress_callback is None:
+            return
+        self.best_num_filled_entries = max(self.best_num_filled_entries, num_filled_entries)
+        self.progress_callback(FillProgress(
+            nodes=self.nodes,
+            elapsed_seconds=self.get_elapsed_seconds(),
+            num_filled_entries=num_filled_entries,
+            best_num_filled_entries=self.best_num_filled_entries,
+        ))
+
+    def get_elapsed_seconds(self) -> float:
+        return time.perf_counter() - self.start_time
@@ -0,0 +1,282 @@
+"""Asyncio fill service: JSON-lines requests served by a warm worker pool."""
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from batch_filler import grid_spec_from_json
+from puzzle import Puzzle
+from puzzle_filler import FILL_STRATEGIES
+from worker_filler import get_worker_puzzle_filler, init_worker_puzzle_filler
+from worker_filler import load_worker_puzzle_filler
+
+# one flag per request slot; a worker stops its fill once its slot's flag
+# is set
+_worker_cancel_flags = None
+
+# Fills poll for cancellation every this many nodes.
+_CANCEL_CHECK_INTERVAL = 20
+
+
+# Serves fill requests, one JSON object per line:
+#   {"id": "...", "ascii": "<Puzzle.import_from_ascii format>"}
+#   {"id": "...", "rows": 15, "cols": 15, "black_squares": [[r, c], ...]}
+# optionally with "strategy", "deadline_seconds" (counted from when the
+# request is read, so time spent queued counts) and "max_nodes". A request
+# {"id": "...", "cancel": true} cancels the fill with that id.
+#
+# Every fill request gets one response line:
+#   {"id", "status", "success", "num_failed_entries", "nodes",
+#    "elapsed_seconds", "queued_seconds", "ascii"}
+# where status is "solved", or why the fill stopped short: "deadline",
+# "node_budget", "cancelled", "unsatisfiable", "incomplete" or "error".
+# A partial fill is still returned in "ascii".
+#
+# At most max_pending requests are queued or running at once. Beyond that
+# the service holds the next fill request and stops reading until one
+# finishes, so clients see backpressure instead of an unbounded queue.
+# Cancels read before that point are handled right away.
+class FillService:
+    words_file: str
+    strategy: str
+    num_workers: int
+    max_pending: int
+    default_deadline_seconds: Optional[float]
+
+    def __init__(
+        self,
+        words_file: str = "wordlist.txt",
+        strategy: str = "csp",
+        num_workers: Optional[int] = None,
+        max_pending: int = 64,
+        default_deadline_seconds: Optional[float] = None,
+    ):
+        assert strategy in FILL_STRATEGIES, f"Unknown fill strategy {strategy}"
+        self.words_file = words_file
+        self.strategy = strategy
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.max_pending = max_pending
+        self.default_deadline_seconds = default_deadline_seconds
+        self.pool = None
+        # request id -> slot of the cancel flag of its fill
+        self.slots_by_id: Dict[str, int] = {}
+        self.free_slots: List[int] = list(range(max_pending))
+
+    def start(self) -> None:
+        global _worker_cancel_flags
+        load_worker_puzzle_filler(self.words_file)
+        _worker_cancel_flags = multiprocessing.Array("b", self.max_pending, lock=False)
+        self.cancel_flags = _worker_cancel_flags
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.pool = ProcessPoolExecutor(
+            self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.words_file, self.cancel_flags),
+        )
+
+    def close(self) -> None:
+        if self.pool is not None:
+            for slot in self.slots_by_id.values():
+                self.cancel_flags[slot] = 1
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    # Fills one request and returns its response. Callers must hold a
+    # pending slot (see serve).
+    async def fill(self, request: dict, received_time: float) -> dict:
+        request_id = str(request.get("id", ""))
+        strategy = request.get("strategy", self.strategy)
+        deadline_seconds = request.get("deadline_seconds", self.default_deadline_seconds)
+        if strategy not in FILL_STRATEGIES:
+            return _error_response(request_id, f"Unknown fill strategy {strategy}")
+        if request_id in self.slots_by_id:
+            return _error_response(request_id, f"Request {request_id} is already running")
+        try:
+            spec = grid_spec_from_json(request, request_id)
+        except Exception as e:
+            return _error_response(request_id, f"Invalid grid: {e!r}")
+
+        slot = self.free_slots.pop()
+        self.cancel_flags[slot] = 0
+        self.slots_by_id[request_id] = slot
+        try:
+            task = (
+                spec.puzzle_ascii,
+                strategy,
+                deadline_seconds,
+                received_time,
+                request.get("max_nodes"),
+                slot,
+            )
+            response = await asyncio.get_running_loop().run_in_executor(
+                self.pool,
+                _fill_request,
+                task,
+            )
+        except Exception as e:
+            response = _error_response(request_id, repr(e))
+        finally:
+            del self.slots_by_id[request_id]
+            self.free_slots.append(slot)
+        response["id"] = request_id
+        return response
+
+    # Cancels the running or queued fill with the given id. Its response
+    # carries the partial fill found so far.
+    def cancel(self, request_id: str) -> bool:
+        slot = self.slots_by_id.get(request_id)
+        if slot is None:
+            return False
+        self.cancel_flags[slot] = 1
+        return True
+
+    # Reads requests from reader until EOF and writes one response line per
+    # request with write_line, in completion order.
+    async def serve(self, reader: asyncio.StreamReader, write_line: Callable[[str], None]) -> None:
+        tasks = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                write_line(json.dumps(_error_response("", f"Invalid JSON: {e}")))
+                continue
+            if not isinstance(request, dict):
+                write_line(json.dumps(_error_response("", "Requests must be JSON objects")))
+                continue
+
+            # cancels never wait for a pending slot, so they get through
+            # while the service is full
+            if request.get("cancel"):
+                request_id = str(request.get("id", ""))
+                write_line(json.dumps({
+                    "id": request_id,
+                    "cancel_requested": self.cancel(request_id),
+                }))
+                continue
+
+            # backpressure: don't read another request until this one has
+            # a slot
+            received_time = time.perf_counter()
+            await self.pending.acquire()
+            task = asyncio.create_task(self._fill_and_respond(
+                request,
+                received_time,
+                write_line,
+            ))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _fill_and_respond(
+        self,
+        request: dict,
+        received_time: float,
+        write_line: Callable[[str], None],
+    ) -> None:
+        # every fill request gets its response line, whatever went wrong
+        try:
+            response = await self.fill(request, received_time)
+        except Exception as e:
+            response = _error_response(str(request.get("id", "")), repr(e))
+        finally:
+            self.pending.release()
+        write_line(json.dumps(response))
+
+
+def _init_worker(words_file: str, cancel_flags) -> None:
+    global _worker_cancel_flags
+    _worker_cancel_flags = cancel_flags
+    # stdout may be carrying responses, so anything a fill prints goes to
+    # stderr instead
+    sys.stdout = sys.stderr
+    init_worker_puzzle_filler(words_file)
+
+
+def _fill_request(task: Tuple[str, str, Optional[float], float, Optional[int], int]) -> dict:
+    puzzle_ascii, strategy, deadline_seconds, received_time, max_nodes, slot = task
+    start_time = time.perf_counter()
+    # perf_counter is system-wide on the platforms we run on, so the
+    # parent's receipt time is comparable with ours
+    queued_seconds = max(0.0, start_time - received_time)
+
+    puzzle = Puzzle.from_ascii(puzzle_ascii)
+    time_limit_seconds = None
+    if deadline_seconds is not None:
+        time_limit_seconds = max(0.0, deadline_seconds - queued_seconds)
+
+    if _worker_cancel_flags[slot] or time_limit_seconds == 0.0:
+        status = "cancelled" if _worker_cancel_flags[slot] else "deadline"
+        return {
+            "status": status,
+            "success": False,
+            "num_failed_entries": len(puzzle.entries),
+            "nodes": 0,
+            "elapsed_seconds": 0.0,
+            "queued_seconds": queued_seconds,
+            "ascii": puzzle.to_ascii(),
+        }
+
+    result = get_worker_puzzle_filler().fill_puzzle_anytime(
+        puzzle,
+        strategy,
+        time_limit_seconds=time_limit_seconds,
+        max_nodes=max_nodes,
+        progress_interval=_CANCEL_CHECK_INTERVAL,
+        cancel_check=lambda: bool(_worker_cancel_flags[slot]),
+    )
+    return {
+        "status": result.status,
+        "success": result.success,
+        "num_failed_entries": result.num_failed_entries,
+        "nodes": result.nodes,
+        "elapsed_seconds": time.perf_counter() - start_time,
+        "queued_seconds": queued_seconds,
+        "ascii": puzzle.to_ascii(),
+    }
+
+
+def _error_response(request_id: str, message: str) -> dict:
+    return {"id": request_id, "status": "error", "success": False, "error": message}
+
+
+# Serves requests from stdin, writing responses to stdout.
+async def serve_stdio(service: FillService) -> None:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    def write_line(line: str) -> None:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    await service.serve(reader, write_line)
+
+
+# Serves requests from every TCP client, each over its own connection. All
+# clients share the service's worker pool and pending limit.
+async def serve_tcp(service: FillService, host: str, port: int) -> None:
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        def write_line(line: str) -> None:
+            if not writer.is_closing():
+                writer.write(line.encode("utf-8") + b"\n")
+
+        try:
+            await service.serve(reader, write_line)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_client, host, port)
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,281 @@
+"""Generates symmetric black-square layouts and screens out unfillable ones."""
+import math
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from csp_solver import CSPSolver
+from entry import Direction
+from puzzle import Puzzle
+from word_filler import WordFiller
+
+
+# Builds random rotationally symmetric layouts in which every white square
+# is part of an across and a down word of at least min_word_length letters,
+# the white squares are connected, and there are at most max_black_squares
+# black squares. With max_word_length, longer slots are broken up first.
+class GridGenerator:
+    rows: int
+    cols: int
+    min_word_length: int
+    max_black_squares: int
+    max_word_length: Optional[int]
+
+    def __init__(
+        self,
+        rows: int,
+        cols: int,
+        min_word_length: int = 3,
+        max_black_squares: Optional[int] = None,
+        max_word_length: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.rows = rows
+        self.cols = cols
+        self.min_word_length = min_word_length
+        # about the most published 15x15 grids allow
+        self.max_black_squares = max_black_squares if max_black_squares is not None \
+            else rows * cols // 6
+        self.max_word_length = max_word_length
+        self.rng = random.Random(seed)
+
+    # Yields distinct layouts as lists of black squares, for
+    # Puzzle.mark_black_squares. Stops after max_attempts layouts in a row
+    # couldn't be built or had been yielded before.
+    def generate(self, max_attempts: int = 1000) -> Iterator[List[Tuple[int, int]]]:
+        seen_layouts = set()
+        num_failed_attempts = 0
+        while num_failed_attempts < max_attempts:
+            black = self._build_layout()
+            if black is None or bytes(black) in seen_layouts:
+                num_failed_attempts += 1
+                continue
+            seen_layouts.add(bytes(black))
+            num_failed_attempts = 0
+            yield [
+                (cell // self.cols, cell % self.cols)
+                for cell, is_black in enumerate(black)
+                if is_black
+            ]
+
+    def build_puzzle(self, black_squares: List[Tuple[int, int]]) -> Puzzle:
+        puzzle = Puzzle(self.rows, self.cols)
+        puzzle.mark_black_squares(black_squares)
+        puzzle.initialize()
+        return puzzle
+
+    # Returns one black byte per cell, or None if the layout couldn't be
+    # built within the constraints.
+    def _build_layout(self) -> Optional[bytearray]:
+        black = bytearray(self.rows * self.cols)
+        if not self._is_valid(black, range(self.rows), range(self.cols)):
+            return None
+        num_black = 0
+
+        # break up the slots that are too long
+        while self.max_word_length is not None:
+            long_slot_cells = [
+                cell
+                for run in self._iter_runs(black, range(self.rows), range(self.cols))
+                if len(run) > self.max_word_length
+                for cell in run
+            ]
+            if not long_slot_cells:
+                break
+            self.rng.shuffle(long_slot_cells)
+            for cell in long_slot_cells:
+                num_added = self._try_add_black_square(black, cell, num_black)
+                if num_added:
+                    num_black += num_added
+                    break
+            else:
+                return None
+
+        # then spend some of what's left of the budget anywhere
+        target_num_black = self.rng.randint(num_black, self.max_black_squares)
+        cells = list(range(self.rows * self.cols))
+        self.rng.shuffle(cells)
+        for cell in cells:
+            if num_black >= target_num_black:
+                break
+            if not black[cell]:
+                num_black += self._try_add_black_square(black, cell, num_black)
+        return black
+
+    # Blackens the cell and its mirror image if that keeps the layout
+    # within the constraints. Returns the number of black squares added.
+    def _try_add_black_square(self, black: bytearray, cell: int, num_black: int) -> int:
+        mirror_cell = len(black) - 1 - cell
+        num_added = 1 if mirror_cell == cell else 2
+        if black[cell] or num_black + num_added > self.max_black_squares:
+            return 0
+
+        black[cell] = black[mirror_cell] = 1
+        rows = {cell // self.cols, mirror_cell // self.cols}
+        cols = {cell % self.cols, mirror_cell % self.cols}
+        if self._is_valid(black, rows, cols) and self._is_connected(black):
+            return num_added
+        black[cell] = black[mirror_cell] = 0
+        return 0
+
+    # Whether every slot in the given rows and columns is long enough.
+    def _is_valid(self, black: bytearray, rows, cols) -> bool:
+        return all(
+            len(run) >= self.min_word_length
+            for run in self._iter_runs(black, rows, cols)
+        )
+
+    # Yields the cells of every run of white squares in the given rows and
+    # columns.
+    def _iter_runs(self, black: bytearray, rows, cols) -> Iterator[List[int]]:
+        lines = [range(r * self.cols, (r + 1) * self.cols) for r in rows]
+        lines += [range(c, self.rows * self.cols, self.cols) for c in cols]
+        for line in lines:
+            run = []
+            for cell in line:
+                if black[cell]:
+                    if run:
+                        yield run
+                    run = []
+                else:
+                    run.append(cell)
+            if run:
+                yield run
+
+    def _is_connected(self, black: bytearray) -> bool:
+        return is_connected(black, self.rows, self.cols)
+
+
+# black byte -> "1" for a white square, "0" for a black one
+_WHITE_DIGIT_TABLE = bytes.maketrans(b"\x00\x01", b"10")
+
+
+# Whether the white squares of a layout, one black byte per cell, form one
+# orthogonally connected region. Floods a bitset of the white squares, one
+# bit per cell plus a black padding column that stops rows from wrapping
+# into each other, so every step grows the region by a square in all
+# directions at once.
+def is_connected(black: bytes, rows: int, cols: int) -> bool:
+    padded = b"\x01".join([bytes(black[i:i + cols]) for i in range(0, rows * cols, cols)])
+    white = int(padded.translate(_WHITE_DIGIT_TABLE)[::-1] or b"0", 2)
+    if not white:
+        return False
+    width = cols + 1
+    reached = white & -white
+    while True:
+        grown = (reached | reached << 1 | reached >> 1 | reached << width | reached >> width) & white
+        if grown == reached:
+            return reached == white
+        reached = grown
+
+
+@dataclass
+class ScreenResult:
+    fillable: bool
+    # why the layout was rejected: "not_enough_words", "propagation" or
+    # "expected_fills"
+    reason: Optional[str] = None
+    # log10 of the number of fills expected if the answers of crossing
+    # entries were independent; None if the layout was rejected first
+    log_expected_fills: Optional[float] = None
+    # the same, divided by the number of open slots, which makes it
+    # comparable across grid sizes
+    log_expected_fills_per_slot: Optional[float] = None
+    # candidates left to the most constrained entry after propagation
+    min_domain_size: int = 0
+    elapsed_seconds: float = 0.0
+
+
+# Cheap checks, cheapest first, that reject layouts a full fill would
+# almost certainly fail on:
+#   1. every slot length has enough dictionary words for its slots
+#   2. AC-3 over the slots' domains leaves every slot a candidate
+#   3. the expected number of fills, per open slot, is at least
+#      10^min_log_expected_fills_per_slot
+# Only the first two are proofs. The estimate multiplies every slot's
+# candidate count by, for every crossing, the chance that two candidates
+# picked at random agree on the shared letter. With wordlist.txt, none of
+# the generated 15x15 layouts below 0.55 per slot filled within 3s under
+# the CSP fill, while the benchmark grids score 0.73 to 0.99.
+class FillabilityScreen:
+    word_filler: WordFiller
+    min_log_expected_fills_per_slot: float
+    allow_duplicate_answers: bool
+
+    def __init__(
+        self,
+        word_filler: WordFiller,
+        min_log_expected_fills_per_slot: float = 0.55,
+        allow_duplicate_answers: bool = False,
+    ):
+        self.word_filler = word_filler
+        self.min_log_expected_fills_per_slot = min_log_expected_fills_per_slot
+        self.allow_duplicate_answers = allow_duplicate_answers
+
+    def screen(self, puzzle: Puzzle) -> ScreenResult:
+        start_time = time.perf_counter()
+        result = self._screen(puzzle)
+        result.elapsed_seconds = time.perf_counter() - start_time
+        return result
+
+    def _screen(self, puzzle: Puzzle) -> ScreenResult:
+        num_slots_by_length = Counter(
+            entry.answer_length for entry in puzzle.entry_list if not entry.is_complete()
+        )
+        for length, num_slots in num_slots_by_length.items():
+            num_words = self.word_filler.get_full_mask(length).bit_count()
+            if num_words == 0 or (num_words < num_slots and not self.allow_duplicate_answers):
+                return ScreenResult(fillable=False, reason="not_enough_words")
+
+        solver = CSPSolver(self.word_filler, allow_duplicate_answers=self.allow_duplicate_answers)
+        if solver.propagate(puzzle) is not None:
+            return ScreenResult(fillable=False, reason="propagation")
+
+        log_expected_fills = self._get_log_expected_fills(puzzle, solver)
+        log_expected_fills_per_slot = log_expected_fills / max(1, len(solver.variables))
+        fillable = log_expected_fills_per_slot >= self.min_log_expected_fills_per_slot
+        return ScreenResult(
+            fillable=fillable,
+            reason=None if fillable else "expected_fills",
+            log_expected_fills=log_expected_fills,
+            log_expected_fills_per_slot=log_expected_fills_per_slot,
+            min_domain_size=min((domain.bit_count() for domain in solver.domains), default=0),
+        )
+
+    def _get_log_expected_fills(self, puzzle: Puzzle, solver: CSPSolver) -> float:
+        var_ids = {entry.id: var for var, entry in enumerate(solver.variables)}
+        # (var, position) -> letter -> number of candidates with that letter
+        letter_counts: Dict[Tuple[int, int], Dict[str, int]] = {}
+
+        def get_letter_counts(var: int, position: int) -> Dict[str, int]:
+            if (var, position) not in letter_counts:
+                domain = solver.domains[var]
+                letter_counts[var, position] = {
+                    letter: (domain & letter_mask).bit_count()
+                    for letter, letter_mask in solver.letter_masks[var][position].items()
+                }
+            return letter_counts[var, position]
+
+        log_expected_fills = sum(math.log10(domain.bit_count()) for domain in solver.domains)
+        for var, entry in enumerate(solver.variables):
+            # count every crossing once, from its across entry
+            if entry.direction != Direction.ACROSS:
+                continue
+            for position, crossing_entry, crossing_position in puzzle.get_crossings(entry):
+                crossing_var = var_ids.get(crossing_entry.id)
+                if crossing_var is None or entry.get_current_hint()[position] != ".":
+                    continue
+                counts = get_letter_counts(var, position)
+                crossing_counts = get_letter_counts(crossing_var, crossing_position)
+                num_agreeing_pairs = sum(
+                    count * crossing_counts.get(letter, 0)
+                    for letter, count in counts.items()
+                )
+                if num_agreeing_pairs == 0:
+                    return -math.inf
+                log_expected_fills += math.log10(num_agreeing_pairs) - math.log10(
+                    solver.domains[var].bit_count() * solver.domains[crossing_var].bit_count()
+                )
+        return log_expected_fills
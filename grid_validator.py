@@ -0,0 +1,236 @@
+"""Checks many completed grids at once against the word list and the grid pattern rules."""
+import os
+import re
+import struct
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from grid_generator import is_connected
+from puzzle import Puzzle
+from puzzle_archive import ARCHIVE_EXTENSION, ArchiveRecord, read_archive
+from puzzle_archive import iter_puzzle_files, read_puz_solution
+from word_filler import WordFiller
+
+# .puz conventions: "." is a black square, "-" an empty one
+BLACK = ord(".")
+EMPTY = ord("-")
+
+_ENTRY_PATTERN = re.compile(rb"[^.]+")
+# cell byte -> 1 if black, else 0
+_BLACK_TABLE = bytes(1 if byte == BLACK else 0 for byte in range(256))
+# shows empty squares the way Entry.get_current_hint does
+_HINT_TABLE = bytes.maketrans(b"-", b".")
+
+
+class PatternViolation:
+    # an entry shorter than min_word_length; the detail is its index_str
+    SHORT_ENTRY = "short_entry"
+    # the black squares don't have rotational symmetry
+    ASYMMETRIC = "asymmetric"
+    # the white squares fall apart into more than one region
+    DISCONNECTED = "disconnected"
+
+
+@dataclass
+class SolutionGrid:
+    grid_id: str
+    rows: int
+    cols: int
+    # one byte per cell, row by row, in the .puz solution format
+    cells: bytes
+    # why the grid couldn't be read, if it couldn't
+    error: Optional[str] = None
+
+
+@dataclass
+class GridValidation:
+    grid_id: str
+    # (index_str, answer) of the entries that aren't in the word list,
+    # incomplete ones included; empty squares show as "."
+    invalid_entries: List[Tuple[str, str]] = field(default_factory=list)
+    # (index_str, answer) of the entries repeating an earlier entry's
+    # answer, in Puzzle.get_duplicate_entries order
+    duplicate_entries: List[Tuple[str, str]] = field(default_factory=list)
+    # (PatternViolation, detail)
+    pattern_violations: List[Tuple[str, str]] = field(default_factory=list)
+    # set for grids that couldn't be read or are malformed; nothing else is
+    # checked for them
+    error: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return not (
+            self.invalid_entries
+            or self.duplicate_entries
+            or self.pattern_violations
+            or self.error is not None
+        )
+
+    def to_json_dict(self) -> dict:
+        return dict(asdict(self), valid=self.valid)
+
+
+# Validates grids the way Puzzle.validate_puzzle and
+# Puzzle.get_duplicate_entries do, plus the pattern rules, without building
+# Puzzles. The entries of a grid are cut out of two byte strings, its rows
+# and its columns joined by black squares, and looked up all at once as a
+# set against a set of the encoded words. Only grids that fail get
+# numbered and walked entry by entry to report where they fail.
+class GridValidator:
+    word_filler: WordFiller
+    min_word_length: int
+    require_symmetry: bool
+    require_connected: bool
+    allow_duplicate_answers: bool
+    # every word in the word list, encoded like Entry.get_hint_bytes
+    words: frozenset
+
+    def __init__(
+        self,
+        word_filler: WordFiller,
+        min_word_length: int = 3,
+        require_symmetry: bool = True,
+        require_connected: bool = True,
+        allow_duplicate_answers: bool = False,
+    ):
+        self.word_filler = word_filler
+        self.min_word_length = min_word_length
+        self.require_symmetry = require_symmetry
+        self.require_connected = require_connected
+        self.allow_duplicate_answers = allow_duplicate_answers
+        self.words = frozenset(
+            word.encode("latin-1")
+            for words in word_filler.words_by_length.values()
+            for word in words
+        )
+
+    def validate_all(self, grids: Iterable[SolutionGrid]) -> Iterator[GridValidation]:
+        for grid in grids:
+            yield self.validate(grid)
+
+    # Malformed grids are reported through GridValidation.error rather than
+    # raised, so that one bad file doesn't stop validate_all.
+    def validate(self, grid: SolutionGrid) -> GridValidation:
+        rows, cols, cells = grid.rows, grid.cols, grid.cells
+        if grid.error is not None:
+            return GridValidation(grid.grid_id, error=grid.error)
+        if len(cells) != rows * cols or rows <= 0 or cols <= 0:
+            return GridValidation(
+                grid.grid_id,
+                error=f"expected {rows * cols} cells, got {len(cells)}",
+            )
+        across_text = b".".join([cells[i:i + cols] for i in range(0, rows * cols, cols)])
+        down_text = b".".join([cells[c::cols] for c in range(cols)])
+        answers = across_text.split(b".") + down_text.split(b".")
+        answers = [answer for answer in answers if answer]
+
+        result = GridValidation(grid.grid_id)
+        black = cells.translate(_BLACK_TABLE)
+        if self.require_symmetry and black != black[::-1]:
+            result.pattern_violations.append((PatternViolation.ASYMMETRIC, ""))
+        if self.require_connected and not is_connected(black, rows, cols):
+            result.pattern_violations.append((PatternViolation.DISCONNECTED, ""))
+
+        if (
+            not self.words.issuperset(answers)
+            or min(map(len, answers), default=self.min_word_length) < self.min_word_length
+            or (not self.allow_duplicate_answers and len(set(answers)) < len(answers))
+        ):
+            self._find_entry_problems(grid, black, across_text, down_text, result)
+        return result
+
+    # Walks the entries of a grid that failed the bulk checks, in
+    # Puzzle.entry_list order, and records the ones at fault.
+    def _find_entry_problems(
+        self,
+        grid: SolutionGrid,
+        black: bytes,
+        across_text: bytes,
+        down_text: bytes,
+        result: GridValidation,
+    ) -> None:
+        rows, cols = grid.rows, grid.cols
+        # start cell -> answer
+        across_answers: Dict[int, bytes] = {}
+        for match in _ENTRY_PATTERN.finditer(across_text):
+            r, c = divmod(match.start(), cols + 1)
+            across_answers[r * cols + c] = match.group()
+        down_answers: Dict[int, bytes] = {}
+        for match in _ENTRY_PATTERN.finditer(down_text):
+            c, r = divmod(match.start(), rows + 1)
+            down_answers[r * cols + c] = match.group()
+
+        seen_answers = set()
+        for cell, index in _number_cells(black, rows, cols).items():
+            for direction, answers in (("A", across_answers), ("D", down_answers)):
+                answer = answers.get(cell)
+                if answer is None:
+                    continue
+                index_str = f"{index}{direction}"
+                hint = answer.translate(_HINT_TABLE).decode("latin-1")
+                if len(answer) < self.min_word_length:
+                    result.pattern_violations.append((PatternViolation.SHORT_ENTRY, index_str))
+                if answer not in self.words:
+                    result.invalid_entries.append((index_str, hint))
+                if EMPTY in answer or self.allow_duplicate_answers:
+                    continue
+                if answer in seen_answers:
+                    result.duplicate_entries.append((index_str, hint))
+                seen_answers.add(answer)
+
+
+# Numbers the white squares the way Puzzle does: every one with a black
+# square or the edge above it or to its left. Returns cell -> index, in
+# cell order.
+def _number_cells(black: bytes, rows: int, cols: int) -> Dict[int, int]:
+    numbers = {}
+    for cell in range(rows * cols):
+        if black[cell]:
+            continue
+        r, c = divmod(cell, cols)
+        if r == 0 or c == 0 or black[cell - cols] or black[cell - 1]:
+            numbers[cell] = len(numbers) + 1
+    return numbers
+
+
+def grid_from_puzzle(puzzle: Puzzle, grid_id: str = "") -> SolutionGrid:
+    return SolutionGrid(grid_id, puzzle.rows, puzzle.cols, puzzle.get_solution_bytes())
+
+
+def grid_from_record(record: ArchiveRecord) -> SolutionGrid:
+    return SolutionGrid(record.puzzle_id, record.rows, record.cols, record.cells)
+
+
+# Reads the grid of a Puzzle.import_from_ascii file as it is written.
+# Unlike importing it as a Puzzle, black squares aren't mirrored, so
+# asymmetric grids stay asymmetric and keep their letters.
+def grid_from_ascii(puzzle_ascii: str, grid_id: str = "") -> SolutionGrid:
+    lines = puzzle_ascii.splitlines()
+    rows = int(lines[0])
+    cols = int(lines[1])
+    grid_lines = lines[6:6 + rows]
+    if len(grid_lines) < rows or any(len(line) != cols for line in grid_lines):
+        raise ValueError(f"{grid_id}: expected {rows} rows of {cols} squares")
+    cells = "".join(grid_lines).replace("*", ".").encode("latin-1")
+    return SolutionGrid(grid_id, rows, cols, cells)
+
+
+# Reads .puz files, puzzle archives and ASCII (Puzzle.import_from_ascii)
+# files, or every such file in the given directories. Grids are named after
+# their files, or their ids in archives. A file that can't be read yields
+# one grid carrying the error, and reading goes on with the next file.
+def read_grids(paths: Iterable[str]) -> Iterator[SolutionGrid]:
+    for file_path in iter_puzzle_files(paths):
+        grid_id, extension = os.path.splitext(os.path.basename(file_path))
+        try:
+            if extension == ".puz":
+                with open(file_path, "rb") as f:
+                    yield SolutionGrid(grid_id, *read_puz_solution(f.read(), grid_id))
+            elif extension == ARCHIVE_EXTENSION:
+                for record in read_archive(file_path):
+                    yield grid_from_record(record)
+            else:
+                with open(file_path, "r") as f:
+                    yield grid_from_ascii(f.read(), grid_id)
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            yield SolutionGrid(grid_id, 0, 0, b"", error=str(e))
@@ -0,0 +1,47 @@
+"""NumPy letter matrices of a word list, for vectorized pattern matching."""
+from typing import Dict, List
+
+import numpy as np
+
+
+# One length bucket of the word list as an (#words x length) uint8 matrix
+# of latin-1 code points. Row i is words[i], so row masks line up with the
+# bitsets of WordFiller.letter_index.
+class LetterMatrix:
+    matrix: np.ndarray
+
+    def __init__(self, words: List[str], length: int):
+        self.matrix = np.frombuffer(
+            "".join(words).encode("latin-1"),
+            dtype=np.uint8,
+        ).reshape(len(words), length)
+
+    # Returns a boolean row mask of the words matching the hint.
+    def get_match_mask(self, hint: str) -> np.ndarray:
+        row_mask = np.ones(len(self.matrix), dtype=bool)
+        for position, letter in enumerate(hint):
+            if letter == ".":
+                continue
+            code_point = ord(letter)
+            if code_point > 255:
+                row_mask[:] = False
+                break
+            row_mask &= self.matrix[:, position] == code_point
+        return row_mask
+
+    # Returns letter -> number of the rows in row_mask with that letter at
+    # the given position, for the letters that occur there.
+    def get_letter_counts(self, row_mask: np.ndarray, position: int) -> Dict[str, int]:
+        counts = np.bincount(self.matrix[row_mask, position], minlength=256)
+        return {
+            chr(code_point): int(counts[code_point])
+            for code_point in np.flatnonzero(counts)
+        }
+
+
+# Converts a boolean row mask to the equivalent WordFiller bitset.
+def row_mask_to_bitset(row_mask: np.ndarray) -> int:
+    return int.from_bytes(
+        np.packbits(row_mask, bitorder="little").tobytes(),
+        "little",
+    )
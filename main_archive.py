@@ -0,0 +1,70 @@
+"""Puzzle archives for xwgen: packs .puz and ASCII puzzle files into one archive, and back."""
+import argparse
+import os
+import sys
+import time
+
+from puzzle_archive import ArchiveWriter, read_archive, read_records
+
+
+def pack(args) -> None:
+    num_packed = 0
+    with ArchiveWriter(args.archive) as archive_writer:
+        for record in read_records(args.inputs):
+            archive_writer.write_record(record)
+            num_packed += 1
+    print(f"Packed {num_packed} puzzles into {args.archive}", file=sys.stderr)
+
+
+def unpack(args) -> None:
+    os.makedirs(args.output_dir, exist_ok=True)
+    num_unpacked = 0
+    for archive in args.archives:
+        for record in read_archive(archive):
+            if args.format == "puz":
+                with open(os.path.join(args.output_dir, record.puzzle_id + ".puz"), "wb") as f:
+                    f.write(record.to_puz_bytes())
+            else:
+                record.to_puzzle().export_as_ascii(
+                    os.path.join(args.output_dir, record.puzzle_id + ".out")
+                )
+            num_unpacked += 1
+    print(f"Unpacked {num_unpacked} puzzles into {args.output_dir}", file=sys.stderr)
+
+
+def list_archives(args) -> None:
+    for archive in args.archives:
+        for record in read_archive(archive):
+            print(f"{record.puzzle_id}\t{record.rows}x{record.cols}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser(
+        "pack",
+        help="append .puz, ASCII and archive files, or directories of them, to an archive",
+    )
+    pack_parser.add_argument("archive")
+    pack_parser.add_argument("inputs", nargs="+")
+    pack_parser.set_defaults(run=pack)
+
+    unpack_parser = subparsers.add_parser("unpack", help="write every archived puzzle to its own file")
+    unpack_parser.add_argument("archives", nargs="+")
+    unpack_parser.add_argument("--output-dir", default="unpacked")
+    unpack_parser.add_argument("--format", choices=("puz", "ascii"), default="puz")
+    unpack_parser.set_defaults(run=unpack)
+
+    list_parser = subparsers.add_parser("list", help="print the id and size of every archived puzzle")
+    list_parser.add_argument("archives", nargs="+")
+    list_parser.set_defaults(run=list_archives)
+
+    args = parser.parse_args()
+    start_time = time.perf_counter()
+    args.run(args)
+    print(f"Done in {time.perf_counter() - start_time:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
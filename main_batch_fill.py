@@ -0,0 +1,68 @@
+"""Batch runner for xwgen: fills many grids and streams out the results."""
+import argparse
+import sys
+import time
+
+from batch_filler import BatchFiller, OUTPUT_FORMATS, get_throughput, read_grid_specs
+from batch_filler import result_to_json
+from puzzle_filler import FILL_STRATEGIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "input",
+        help="directory of ASCII puzzle files, or a JSONL file of grids ('-' for stdin)",
+    )
+    parser.add_argument("--output-dir", default="filled")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="puz")
+    parser.add_argument("--strategy", choices=sorted(FILL_STRATEGIES), default="csp")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=None,
+        help="seconds per grid; grids that run out keep their best partial fill",
+    )
+    parser.add_argument("--max-nodes", type=int, default=None, help="search nodes per grid")
+    parser.add_argument(
+        "--words-file",
+        nargs="+",
+        default="wordlist.txt",
+        help="word list, or several to merge",
+    )
+    args = parser.parse_args()
+
+    batch_filler = BatchFiller(
+        output_dir=args.output_dir,
+        words_file=args.words_file,
+        strategy=args.strategy,
+        output_format=args.format,
+        num_workers=args.workers,
+        time_limit_seconds=args.time_limit,
+        max_nodes=args.max_nodes,
+    )
+
+    start_time = time.perf_counter()
+    results = []
+    for result in batch_filler.fill_all(read_grid_specs(args.input, sys.stdin)):
+        results.append(result)
+        print(result_to_json(result), flush=True)
+
+    wall_seconds = time.perf_counter() - start_time
+    num_succeeded = sum(1 for result in results if result.success)
+    num_out_of_budget = sum(
+        1 for result in results if result.status in ("deadline", "node_budget")
+    )
+    num_errors = sum(1 for result in results if result.status == "error")
+    print(
+        f"Filled {num_succeeded}/{len(results)} puzzles in {wall_seconds:.1f}s, "
+        f"{num_out_of_budget} out of budget, {num_errors} errors "
+        f"({get_throughput(results, wall_seconds, batch_filler.num_workers):.1f} "
+        f"puzzles/min/worker)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark runner for xwgen: fill strategies and dictionary operations."""
+import argparse
+import json
+import sys
+
+from benchmark import BENCHMARK_GRIDS, results_to_dict, run_dictionary_benchmarks
+from benchmark import run_fill_benchmarks
+from puzzle_filler import FILL_STRATEGIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default="-", help="JSON output file ('-' for stdout)")
+    parser.add_argument("--grids", nargs="+", choices=BENCHMARK_GRIDS, default=None)
+    parser.add_argument("--strategies", nargs="+", choices=sorted(FILL_STRATEGIES), default=None)
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0, 1, 2])
+    parser.add_argument("--num-hints", type=int, default=2000)
+    parser.add_argument("--words-file", default="wordlist.txt")
+    parser.add_argument("--skip-fills", action="store_true")
+    parser.add_argument("--skip-dictionary", action="store_true")
+    args = parser.parse_args()
+
+    fill_results = []
+    if not args.skip_fills:
+        fill_results = run_fill_benchmarks(
+            words_file=args.words_file,
+            grids=args.grids,
+            strategies=args.strategies,
+            seeds=args.seeds,
+        )
+        for result in fill_results:
+            print(
+                f"{result.grid:>14} {result.strategy:>12} seed={result.seed}: "
+                f"{result.elapsed_seconds:7.2f}s, {result.num_failed_entries} failed entries"
+                + (f" ({result.error})" if result.error else ""),
+                file=sys.stderr,
+            )
+
+    dictionary_results = []
+    if not args.skip_dictionary:
+        dictionary_results = run_dictionary_benchmarks(
+            words_file=args.words_file,
+            num_hints=args.num_hints,
+            seed=args.seeds[0],
+        )
+
+    report = json.dumps(results_to_dict(fill_results, dictionary_results), indent=2)
+    if args.output == "-":
+        print(report)
+    else:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Benchmarks per-query latency of the WordFiller match backends."""
+import argparse
+import time
+
+from benchmark import generate_hints
+from word_filler import MatchBackend, WordFiller
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--words-file", default="wordlist.txt")
+    parser.add_argument("--num-hints", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backends = [MatchBackend.BITSET, MatchBackend.NUMPY]
+    for backend in backends:
+        # no pattern cache, so every query is matched from scratch
+        word_filler = WordFiller(args.words_file, pattern_cache_bytes=0, backend=backend)
+        hints = generate_hints(word_filler, args.num_hints, args.seed)
+        # warm up: decode every length bucket and build the letter matrices
+        for hint in hints:
+            word_filler.get_mask_for_hint(hint)
+
+        start_time = time.perf_counter()
+        for hint in hints:
+            word_filler.get_mask_for_hint(hint)
+        match_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for i, hint in enumerate(hints):
+            word_filler.get_letter_counts_for_hint(hint, i % len(hint))
+        letter_counts_seconds = time.perf_counter() - start_time
+
+        print(
+            f"{backend:>8}: {match_seconds / len(hints) * 1e6:8.1f} us/match, "
+            f"{letter_counts_seconds / len(hints) * 1e6:8.1f} us/letter counts",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,8 @@ def main():
     puzzle.render()
 
     puzzle_filler = PuzzleFiller()
-    puzzle_filler.fill_puzzle_using_heuristic(puzzle)
+    # keeps the letters already in the grid and fills in only the rest
+    puzzle_filler.resume_fill(puzzle)
 
     puzzle.render()
     print("______________________________________")
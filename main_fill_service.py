@@ -0,0 +1,62 @@
+"""Fill service for xwgen: fills grids sent as JSON lines on stdin or TCP."""
+import argparse
+import asyncio
+
+from fill_service import FillService, serve_stdio, serve_tcp
+from puzzle_filler import FILL_STRATEGIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--words-file",
+        nargs="+",
+        default="wordlist.txt",
+        help="word list, or several to merge",
+    )
+    parser.add_argument("--strategy", choices=sorted(FILL_STRATEGIES), default="csp")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=64,
+        help="requests queued or running at once before reading pauses",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="default per-request deadline in seconds",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="serve over TCP on this port instead of stdin/stdout",
+    )
+    args = parser.parse_args()
+
+    service = FillService(
+        words_file=args.words_file,
+        strategy=args.strategy,
+        num_workers=args.workers,
+        max_pending=args.max_pending,
+        default_deadline_seconds=args.deadline,
+    )
+
+    async def run():
+        service.start()
+        try:
+            if args.port is None:
+                await serve_stdio(service)
+            else:
+                await serve_tcp(service, args.host, args.port)
+        finally:
+            service.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Grid generator for xwgen: writes screened layouts as JSONL grids for batch filling."""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+
+from grid_generator import FillabilityScreen, GridGenerator
+from word_filler import WordFiller
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("rows", type=int)
+    parser.add_argument("cols", type=int)
+    parser.add_argument("--count", type=int, default=10, help="layouts to write")
+    parser.add_argument("--min-word-length", type=int, default=3)
+    parser.add_argument("--max-word-length", type=int, default=None)
+    parser.add_argument("--max-black-squares", type=int, default=None)
+    parser.add_argument(
+        "--min-log-expected-fills-per-slot",
+        type=float,
+        default=0.55,
+        help="reject layouts expected to have fewer than 10^(this * #slots) fills",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--words-file",
+        nargs="+",
+        default="wordlist.txt",
+        help="word list, or several to merge",
+    )
+    args = parser.parse_args()
+
+    grid_generator = GridGenerator(
+        args.rows,
+        args.cols,
+        min_word_length=args.min_word_length,
+        max_black_squares=args.max_black_squares,
+        max_word_length=args.max_word_length,
+        seed=args.seed,
+    )
+    screen = FillabilityScreen(
+        WordFiller(args.words_file),
+        min_log_expected_fills_per_slot=args.min_log_expected_fills_per_slot,
+    )
+
+    id_prefix = f"{args.rows}x{args.cols}"
+    if args.seed is not None:
+        id_prefix += f"_seed{args.seed}"
+
+    start_time = time.perf_counter()
+    num_written = 0
+    rejections = Counter()
+    for black_squares in grid_generator.generate():
+        result = screen.screen(grid_generator.build_puzzle(black_squares))
+        if not result.fillable:
+            rejections[result.reason] += 1
+            continue
+        print(json.dumps({
+            "id": f"{id_prefix}_{num_written}",
+            "rows": args.rows,
+            "cols": args.cols,
+            "black_squares": black_squares,
+            "log_expected_fills_per_slot": result.log_expected_fills_per_slot,
+        }), flush=True)
+        num_written += 1
+        if num_written >= args.count:
+            break
+
+    print(
+        f"Wrote {num_written} layouts in {time.perf_counter() - start_time:.1f}s, "
+        f"rejected {sum(rejections.values())} {dict(rejections)}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
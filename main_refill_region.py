@@ -0,0 +1,65 @@
+"""Region re-fill for xwgen: clears part of a filled ASCII puzzle and fills it again."""
+import argparse
+import sys
+
+from puzzle import Puzzle
+from puzzle_filler import PuzzleFiller
+
+
+def parse_square(square_str: str):
+    r, c = square_str.split(",")
+    return int(r), int(c)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("input", help="ASCII puzzle file, possibly partially filled")
+    parser.add_argument("--output", default=None, help="defaults to overwriting the input")
+    parser.add_argument(
+        "--clear-entries",
+        nargs="*",
+        default=[],
+        help="entries to clear, like 1A 5D",
+    )
+    parser.add_argument(
+        "--clear-squares",
+        nargs="*",
+        type=parse_square,
+        default=[],
+        help="squares to clear, as row,col",
+    )
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds")
+    parser.add_argument(
+        "--words-file",
+        nargs="+",
+        default="wordlist.txt",
+        help="word list, or several to merge",
+    )
+    args = parser.parse_args()
+
+    puzzle = Puzzle.import_from_ascii(args.input)
+    puzzle_filler = PuzzleFiller(args.words_file)
+    # with nothing to clear, just fills in whatever is still open
+    result = puzzle_filler.refill_region(
+        puzzle,
+        squares=args.clear_squares,
+        entry_index_strs=args.clear_entries,
+        time_limit_seconds=args.time_limit,
+    )
+    puzzle.render()
+
+    print(
+        f"{result.status}: filled {len(result.answers)} entries in "
+        f"{result.elapsed_seconds:.2f}s ({result.nodes} nodes)",
+        file=sys.stderr,
+    )
+    for index_str, answer in sorted(result.answers.items()):
+        print(index_str, answer, file=sys.stderr)
+
+    puzzle.export_as_ascii(args.output or args.input)
+    if not result.success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Grid validator for xwgen: checks completed .puz and ASCII grids and reports the failures as JSONL."""
+import argparse
+import json
+import sys
+import time
+
+from grid_validator import GridValidator, read_grids
+from word_filler import WordFiller
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("paths", nargs="+", help=".puz or ASCII puzzle files, or directories of them")
+    parser.add_argument("--min-word-length", type=int, default=3)
+    parser.add_argument("--allow-asymmetric", action="store_true")
+    parser.add_argument("--allow-disconnected", action="store_true")
+    parser.add_argument("--allow-duplicate-answers", action="store_true")
+    parser.add_argument("--all", action="store_true", help="report valid grids too")
+    parser.add_argument(
+        "--words-file",
+        nargs="+",
+        default="wordlist.txt",
+        help="word list, or several to merge",
+    )
+    args = parser.parse_args()
+
+    validator = GridValidator(
+        WordFiller(args.words_file),
+        min_word_length=args.min_word_length,
+        require_symmetry=not args.allow_asymmetric,
+        require_connected=not args.allow_disconnected,
+        allow_duplicate_answers=args.allow_duplicate_answers,
+    )
+
+    start_time = time.perf_counter()
+    num_grids = 0
+    num_invalid = 0
+    for result in validator.validate_all(read_grids(args.paths)):
+        num_grids += 1
+        if not result.valid:
+            num_invalid += 1
+        if args.all or not result.valid:
+            print(json.dumps(result.to_json_dict()), flush=True)
+
+    print(
+        f"Validated {num_grids} grids in {time.perf_counter() - start_time:.1f}s, "
+        f"{num_invalid} invalid",
+        file=sys.stderr,
+    )
+    if num_invalid:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Runs independently seeded fills of one grid in parallel."""
+import multiprocessing
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from puzzle import Puzzle
+from puzzle_filler import FILL_STRATEGIES, PuzzleFiller
+
+@dataclass
+class PortfolioResult:
+    # seed of the run whose fill was kept
+    seed: int
+    # the kept run's FillResult status
+    status: str
+    # number of invalid entries per Puzzle.validate_puzzle; 0 means the
+    # fill is complete and valid
+    num_failed_entries: int
+    # number of runs that finished before the portfolio stopped
+    num_finished_runs: int
+    elapsed_seconds: float
+
+
+# Fills the same grid once per seed, one seed per worker process, and keeps
+# the first complete fill. Every run fills within the same time and node
+# budget and keeps its best partial fill, and if no run succeeds, the fill
+# with the fewest invalid entries wins. Since every run starts its candidate lists at
+# different dictionary offsets (or, with scored word lists, breaks score
+# ties differently), runs explore different parts of the search space, and
+# the slowest seeds stop mattering once any seed succeeds.
+class PortfolioFiller:
+    words_file: str
+    strategy: str
+    num_workers: int
+    # budget of every run; None means unlimited
+    time_limit_seconds: Optional[float]
+    max_nodes: Optional[int]
+
+    def __init__(
+        self,
+        words_file: str = "wordlist.txt",
+        strategy: str = "csp",
+        num_workers: Optional[int] = None,
+        time_limit_seconds: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+    ):
+        assert strategy in FILL_STRATEGIES, f"Unknown fill strategy {strategy}"
+        self.words_file = words_file
+        self.strategy = strategy
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.time_limit_seconds = time_limit_seconds
+        self.max_nodes = max_nodes
+
+    # Fills the puzzle in place with the winning run's fill.
+    def fill(self, puzzle: Puzzle, seeds: Optional[List[int]] = None) -> PortfolioResult:
+        start_time = time.perf_counter()
+        if seeds is None:
+            seeds = list(range(self.num_workers))
+
+        # compile the word list cache up front instead of in every worker
+        PuzzleFiller(self.words_file)
+
+        puzzle_ascii = puzzle.to_ascii()
+        tasks = [
+            (
+                self.strategy,
+                self.words_file,
+                puzzle_ascii,
+                seed,
+                self.time_limit_seconds,
+                self.max_nodes,
+            )
+            for seed in seeds
+        ]
+
+        best: Optional[_SeedFill] = None
+        num_finished_runs = 0
+        pool = multiprocessing.Pool(min(self.num_workers, len(seeds)))
+        try:
+            for seed_fill in pool.imap_unordered(_fill_with_seed, tasks):
+                num_finished_runs += 1
+                if best is None or seed_fill.num_failed_entries < best.num_failed_entries:
+                    best = seed_fill
+                if seed_fill.num_failed_entries == 0:
+                    break
+        finally:
+            # stops the runs that are still going
+            pool.terminate()
+            pool.join()
+
+        # only the letters and the clues the run wrote come back, so the
+        # puzzle's other clues are left as they were
+        puzzle.letters[:] = best.letters
+        for index_str, clue in best.clues.items():
+            puzzle.entries[index_str].clue = clue
+        return PortfolioResult(
+            seed=best.seed,
+            status=best.status,
+            num_failed_entries=best.num_failed_entries,
+            num_finished_runs=num_finished_runs,
+            elapsed_seconds=time.perf_counter() - start_time,
+        )
+
+
+# What one seed's run sends back: its fill, kept even if it failed.
+@dataclass
+class _SeedFill:
+    seed: int
+    status: str
+    num_failed_entries: int
+    letters: bytes
+    # index_str -> clue, of the entries whose clue the fill changed
+    clues: Dict[str, str]
+
+
+def _fill_with_seed(
+    task: Tuple[str, str, str, int, Optional[float], Optional[int]]
+) -> _SeedFill:
+    strategy, words_file, puzzle_ascii, seed, time_limit_seconds, max_nodes = task
+    puzzle = Puzzle.from_ascii(puzzle_ascii)
+    clues_before = {index_str: entry.clue for index_str, entry in puzzle.entries.items()}
+    puzzle_filler = PuzzleFiller(words_file, seed=seed)
+    result = puzzle_filler.fill_puzzle_anytime(
+        puzzle,
+        strategy=strategy,
+        time_limit_seconds=time_limit_seconds,
+        max_nodes=max_nodes,
+    )
+    return _SeedFill(
+        seed=seed,
+        status=result.status,
+        num_failed_entries=result.num_failed_entries,
+        letters=bytes(puzzle.letters),
+        clues={
+            index_str: entry.clue
+            for index_str, entry in puzzle.entries.items()
+            if entry.clue != clues_before[index_str]
+        },
+    )
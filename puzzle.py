@@ -1,9 +1,11 @@
 """Class representing the crossword grid."""
 import collections
-from typing import List, Tuple, Dict
+from array import array
+from typing import Iterable, List, Tuple, Dict, Optional
 
 from entry import Entry, Direction
-from square import Square
+from entry_priority_queue import EntryPriorityQueue
+from square import EMPTY_LETTER, Square
 from string_utils import merge_strings_with_same_num_lines
 from string_utils import remove_last_line_from_string
 from word_filler import WordFiller
@@ -18,17 +20,65 @@ class Puzzle:
     note: str
     rows: int
     cols: int
+    # Square views onto the flat arrays below
     grid: List[List[Square]]
+    # one byte per cell, row-major: the letter, or "." if the cell is empty
+    letters: bytearray
+    # one byte per cell, row-major: 1 for black squares, 0 otherwise
+    black: bytearray
     index: int
     entries: Dict[str, Entry]
+    # entries by Entry.id, and cell -> id of the across/down entry covering
+    # it (-1 for black squares), set by initialize()
+    entry_list: List[Entry]
+    across_ids: array
+    down_ids: array
+    # entry id -> (position in entry, crossing entry, position in crossing
+    # entry) for each of the entry's squares, set by initialize(). The grid
+    # shape doesn't change during a fill, so neither does this.
+    crossing_graph: List[List[Tuple[int, Entry, int]]]
+    # answer length -> entries of that length, set by initialize()
+    entries_by_length: Dict[int, List[Entry]]
+    # set by init_domains(); while set, fill_entry narrows the domains of
+    # the entries crossing the filled-in squares.
+    domain_word_filler: Optional[WordFiller]
+    # whether the domains of open entries leave out the answers already in
+    # the grid, so that no answer is placed twice
+    exclude_used_words: bool
+    # answer length -> bitset over the domain word filler's words of that
+    # length of the answers of complete entries
+    used_masks: Dict[int, int]
+    # the open entries whose domains the last placement narrowed by taking
+    # out the answers it completed
+    excluded_word_entries: List[Entry]
+    # (cell, previous letter), (entry, previous domain) and (length,
+    # previous used mask) changes, and the trail lengths at each open
+    # checkpoint
+    _letter_trail: List[Tuple[int, int]]
+    _domain_trail: List[Tuple[Entry, Optional[int]]]
+    _used_trail: List[Tuple[int, int]]
+    _checkpoints: List[Tuple[int, int, int]]
 
     def __init__(self, rows: int, cols: int):
         self.rows = rows
         self.cols = cols
         self.author = self.title = self.copyright = self.note = ""
 
-        self.grid = [[Square() for _ in range(cols)] for _ in range(rows)]
+        self.letters = bytearray([EMPTY_LETTER]) * (rows * cols)
+        self.black = bytearray(rows * cols)
+        self.grid = [
+            [Square(letters=self.letters, black=self.black, cell=r * cols + c) for c in range(cols)]
+            for r in range(rows)
+        ]
         self.index = 0
+        self.domain_word_filler = None
+        self.exclude_used_words = False
+        self.used_masks = {}
+        self.excluded_word_entries = []
+        self._letter_trail = []
+        self._domain_trail = []
+        self._used_trail = []
+        self._checkpoints = []
 
     def get_next_index(self):
         self.index += 1
@@ -50,6 +100,7 @@ class Puzzle:
     def initialize(self) -> None:
         self._number_squares()
         self.entries = self._generate_entries_from_numbered_squares()
+        self._index_entries()
 
     def _number_squares(self) -> None:
         for r, row in enumerate(self.grid):
@@ -86,9 +137,10 @@ class Puzzle:
                         i,
                         squares=squares_for_entry,
                     )
-                    entries[entry.index_str()] = entry
+                    index_str = entry.index_str()
+                    entries[index_str] = entry
                     for square_for_entry in squares_for_entry:
-                        square_for_entry.across_entry_parent = entry.index_str()
+                        square_for_entry.across_entry_parent = index_str
 
                 if square.starts_down_word:
                     i = 0
@@ -105,12 +157,43 @@ class Puzzle:
                         i,
                         squares=squares_for_entry
                     )
-                    entries[entry.index_str()] = entry
+                    index_str = entry.index_str()
+                    entries[index_str] = entry
                     for square_for_entry in squares_for_entry:
-                        square_for_entry.down_entry_parent = entry.index_str()
+                        square_for_entry.down_entry_parent = index_str
 
         return entries
 
+    def _index_entries(self) -> None:
+        self.entry_list = list(self.entries.values())
+        self.across_ids = array("i", [-1]) * (self.rows * self.cols)
+        self.down_ids = array("i", [-1]) * (self.rows * self.cols)
+        for entry_id, entry in enumerate(self.entry_list):
+            entry.id = entry_id
+            entry.grid_letters = self.letters
+            entry.start_cell = entry.row_in_grid * self.cols + entry.col_in_grid
+            entry.cell_step = 1 if entry.direction == Direction.ACROSS else self.cols
+            ids = self.across_ids if entry.direction == Direction.ACROSS else self.down_ids
+            for cell in entry.get_cells():
+                ids[cell] = entry_id
+        self._build_crossing_graph()
+        self.entries_by_length = collections.defaultdict(list)
+        for entry in self.entry_list:
+            self.entries_by_length[entry.answer_length].append(entry)
+
+    def _build_crossing_graph(self) -> None:
+        self.crossing_graph = []
+        for entry in self.entry_list:
+            crossing_ids = self.down_ids if entry.direction == Direction.ACROSS else self.across_ids
+            crossings = []
+            entry.crossings = {}
+            for position, cell in enumerate(entry.get_cells()):
+                crossing_entry = self.entry_list[crossing_ids[cell]]
+                crossing_position = (cell - crossing_entry.start_cell) // crossing_entry.cell_step
+                crossings.append((position, crossing_entry, crossing_position))
+                entry.crossings[crossing_entry.id] = (position, crossing_position)
+            self.crossing_graph.append(crossings)
+
     def get_entries_sorted_by_length_asc(self) -> List[Entry]:
         entries = self.get_entries_sorted_by_length_desc()
         entries.reverse()
@@ -147,6 +230,22 @@ class Puzzle:
         entries_list.sort(key=entry_sort_by_fn, reverse=True)
         return entries_list
 
+    # Same order as get_entries_sorted_by_fill_priority_desc, but as a queue
+    # that can be updated one entry at a time as the grid changes.
+    def get_fill_priority_queue(self, word_filler: WordFiller) -> EntryPriorityQueue:
+        queue = EntryPriorityQueue(self.entries.values())
+        for entry in self.entries.values():
+            queue.update(entry, entry.get_fill_priority(word_filler))
+        return queue
+
+    # Returns the entries that share a square with the given squares.
+    def get_entries_for_squares(self, squares: List[Square]) -> List[Entry]:
+        entry_ids = {}
+        for square in squares:
+            entry_ids[self.across_ids[square.cell]] = True
+            entry_ids[self.down_ids[square.cell]] = True
+        return [self.entry_list[entry_id] for entry_id in entry_ids]
+
     def get_entries_sorted_by_index_str_asc(self) -> List[Entry]:
         entries_list = []
         for entry in self.entries.values():
@@ -160,38 +259,281 @@ class Puzzle:
         entries_list.sort(key=entry_sort_by_fn, reverse=True)
         return entries_list
 
+    # Returns (position in entry, crossing entry, position in crossing entry)
+    # for every square of the given entry. The list is shared; don't modify
+    # it.
+    def get_crossings(self, entry: Entry) -> List[Tuple[int, Entry, int]]:
+        return self.crossing_graph[entry.id]
+
+    # Returns (position in entry, position in other_entry) of the square
+    # the two entries share, or None if they don't cross.
+    def get_shared_square(self, entry: Entry, other_entry: Entry) -> Optional[Tuple[int, int]]:
+        return entry.crossings.get(other_entry.id)
+
+    # Splits the entries into groups that are connected through crossings
+    # with each other, in entry order.
+    def get_connected_components(self, entries: Iterable[Entry]) -> List[List[Entry]]:
+        remaining_ids = {entry.id for entry in entries}
+        components = []
+        for entry_id in sorted(remaining_ids):
+            if entry_id not in remaining_ids:
+                continue
+            remaining_ids.discard(entry_id)
+            component_ids = [entry_id]
+            stack = [entry_id]
+            while stack:
+                for crossing_id in self.entry_list[stack.pop()].crossings:
+                    if crossing_id in remaining_ids:
+                        remaining_ids.discard(crossing_id)
+                        component_ids.append(crossing_id)
+                        stack.append(crossing_id)
+            components.append([self.entry_list[i] for i in sorted(component_ids)])
+        return components
+
+    """
+    Functions to track the live candidate domain of every entry.
+    """
+
+    # Computes every entry's domain from its current hint. From then on,
+    # fill_entry keeps the domains in sync with the letters it places. With
+    # exclude_used_words, the domains of open entries also leave out every
+    # answer already in the grid, and lose each answer as it is placed.
+    def init_domains(self, word_filler: WordFiller, exclude_used_words: bool = True) -> None:
+        self.domain_word_filler = word_filler
+        self.exclude_used_words = exclude_used_words
+        self.used_masks = self._compute_used_masks() if exclude_used_words else {}
+        for entry in self.entry_list:
+            entry.domain = self._compute_domain(entry)
+
+    def _compute_used_masks(self) -> Dict[int, int]:
+        used_masks = {}
+        for entry in self.entry_list:
+            if entry.is_complete():
+                used_masks[entry.answer_length] = used_masks.get(entry.answer_length, 0) | \
+                    self.domain_word_filler.get_mask_for_hint(entry.get_current_hint())
+        return used_masks
+
+    # The entry's domain computed from scratch from its current hint.
+    def _compute_domain(self, entry: Entry) -> int:
+        if entry.is_complete():
+            return self.domain_word_filler.get_mask_for_hint(entry.get_current_hint())
+        return self.domain_word_filler.get_mask_for_hint(
+            entry.get_current_hint(),
+            exclude_mask=self.used_masks.get(entry.answer_length, 0),
+        )
+
+    # Returns the domain the crossing entry would have after placing the
+    # given letter at crossing_position.
+    def get_narrowed_domain(
+        self,
+        crossing_entry: Entry,
+        crossing_position: int,
+        letter: str,
+    ) -> int:
+        return crossing_entry.domain & self.domain_word_filler.get_mask_for_letter(
+            crossing_entry.answer_length,
+            crossing_position,
+            letter,
+        )
+
     # Fills an entry of the puzzle with a provided guess.
     # Returns a list of the affected squares.
     def fill_entry(self, entry: Entry, answer: str) -> List[Square]:
+        entry.clue = "Clue for " + answer
+        return [
+            self.grid[cell // self.cols][cell % self.cols]
+            for cell in self.place_answer(entry, answer)
+        ]
+
+    # Writes the answer's letters into the grid without touching the clue,
+    # for trial placements. Returns the cells whose letter changed.
+    def place_answer(self, entry: Entry, answer: str) -> List[int]:
         assert len(answer) == entry.answer_length, \
             f"Answer {answer} has length {len(answer)}, but entry " \
             f"{entry.index_str()} has length {entry.answer_length}"
 
-        entry.clue = "Clue for " + answer
+        changed_cells = []
+        self.excluded_word_entries = []
+        overwrote_letters = False
+        letters = self.letters
+        recording = len(self._checkpoints) > 0
+        for cell, letter in zip(entry.get_cells(), answer.encode("latin-1")):
+            old_letter = letters[cell]
+            if old_letter != letter:
+                overwrote_letters |= old_letter != EMPTY_LETTER
+                if recording:
+                    self._letter_trail.append((cell, old_letter))
+                letters[cell] = letter
+                changed_cells.append(cell)
+
+        if self.domain_word_filler is not None and changed_cells:
+            if overwrote_letters:
+                self._recompute_domains_after_overwrite(entry)
+            else:
+                self.excluded_word_entries = self._narrow_domains_after_fill(
+                    entry,
+                    answer,
+                    changed_cells,
+                )
+
+        return changed_cells
 
-        newly_affected_squares = []
-        r = entry.row_in_grid
-        c = entry.col_in_grid
-        if entry.direction == Direction.DOWN:
-            for i, letter in enumerate(answer):
-                square = self.grid[r + i][c]
-                if square.letter != letter:
-                    square.letter = letter
-                    newly_affected_squares.append(square)
-        else:
-            for i, letter in enumerate(answer):
-                square = self.grid[r][c+i]
-                if square.letter != letter:
-                    square.letter = letter
-                    newly_affected_squares.append(square)
-
-        return newly_affected_squares
+    def _narrow_domains_after_fill(
+        self,
+        entry: Entry,
+        answer: str,
+        changed_cells: List[int],
+    ) -> List[Entry]:
+        word_filler = self.domain_word_filler
+        self._set_domain(entry, word_filler.get_mask_for_hint(answer))
+        completed_entries = [entry]
+        for i, crossing_entry, crossing_position in self.get_crossings(entry):
+            self._set_domain(crossing_entry, self.get_narrowed_domain(
+                crossing_entry,
+                crossing_position,
+                answer[i],
+            ))
+            if self.exclude_used_words and crossing_entry.is_complete() and \
+                    entry.start_cell + i * entry.cell_step in changed_cells:
+                completed_entries.append(crossing_entry)
+
+        excluded_word_entries = []
+        if self.exclude_used_words:
+            for completed_entry in completed_entries:
+                excluded_word_entries += self._exclude_used_word(
+                    completed_entry.answer_length,
+                    word_filler.get_mask_for_hint(completed_entry.get_current_hint()),
+                )
+        return excluded_word_entries
+
+    # Marks the word as used, and takes it out of the domains of the open
+    # entries of its length. Returns the entries whose domains it narrowed.
+    def _exclude_used_word(self, length: int, word_mask: int) -> List[Entry]:
+        if not word_mask:
+            return []
+        self._set_used_mask(length, self.used_masks.get(length, 0) | word_mask)
+        narrowed_entries = []
+        for other_entry in self.entries_by_length[length]:
+            if other_entry.domain & word_mask and not other_entry.is_complete():
+                self._set_domain(other_entry, other_entry.domain & ~word_mask)
+                narrowed_entries.append(other_entry)
+        return narrowed_entries
+
+    # An AND can only narrow a domain, so replacing letters means
+    # recomputing domains from scratch: the crossing entries' and, since
+    # the overwrite may have broken answers that were in use, every other
+    # open entry's.
+    def _recompute_domains_after_overwrite(self, entry: Entry) -> None:
+        if not self.exclude_used_words:
+            self._set_domain(entry, self._compute_domain(entry))
+            for _, crossing_entry, _ in self.get_crossings(entry):
+                self._set_domain(crossing_entry, self._compute_domain(crossing_entry))
+            return
+
+        used_masks = self._compute_used_masks()
+        for length in set(used_masks) | set(self.used_masks):
+            self._set_used_mask(length, used_masks.get(length, 0))
+        for other_entry in self.entry_list:
+            self._set_domain(other_entry, self._compute_domain(other_entry))
+
+    def _set_used_mask(self, length: int, used_mask: int) -> None:
+        previous_mask = self.used_masks.get(length, 0)
+        if previous_mask == used_mask:
+            return
+        if self._checkpoints:
+            self._used_trail.append((length, previous_mask))
+        self.used_masks[length] = used_mask
+
+    def _set_domain(self, entry: Entry, domain: int) -> None:
+        if entry.domain == domain:
+            return
+        if self._checkpoints:
+            self._domain_trail.append((entry, entry.domain))
+        entry.domain = domain
+
+    # Erases the letters of the given (row, col) squares, and returns the
+    # entries that cover them, in entry order. Tracked domains are
+    # recomputed.
+    def clear_squares(self, coordinates: Iterable[Tuple[int, int]]) -> List[Entry]:
+        recording = len(self._checkpoints) > 0
+        cleared_ids = set()
+        for r, c in coordinates:
+            cell = r * self.cols + c
+            if self.black[cell]:
+                continue
+            if recording and self.letters[cell] != EMPTY_LETTER:
+                self._letter_trail.append((cell, self.letters[cell]))
+            self.letters[cell] = EMPTY_LETTER
+            cleared_ids.add(self.across_ids[cell])
+            cleared_ids.add(self.down_ids[cell])
+        if self.domain_word_filler is not None:
+            self.init_domains(self.domain_word_filler, self.exclude_used_words)
+        cleared_ids.discard(-1)
+        return [self.entry_list[entry_id] for entry_id in sorted(cleared_ids)]
 
     # Idempotently erases a letter from a list of Squares.
     def erase_squares(self, squares: List[Square]) -> None:
+        recording = len(self._checkpoints) > 0
         for square in squares:
+            if recording and self.letters[square.cell] != EMPTY_LETTER:
+                self._letter_trail.append((square.cell, self.letters[square.cell]))
             square.letter = None
 
+    """
+    Functions to undo changes to the grid. Changes are journaled only while
+    a checkpoint is open, so undoing costs O(changes) rather than a copy
+    of the grid and of every domain.
+    """
+
+    # Opens a checkpoint and returns its id. Checkpoints nest.
+    def checkpoint(self) -> int:
+        self._checkpoints.append((
+            len(self._letter_trail),
+            len(self._domain_trail),
+            len(self._used_trail),
+        ))
+        return len(self._checkpoints) - 1
+
+    # Undoes every letter, domain and used word change made since the
+    # checkpoint was opened, and closes it along with any checkpoints opened
+    # after it.
+    def rollback(self, checkpoint_id: int) -> None:
+        letter_mark, domain_mark, used_mark = self._checkpoints[checkpoint_id]
+        letters = self.letters
+        while len(self._letter_trail) > letter_mark:
+            cell, letter = self._letter_trail.pop()
+            letters[cell] = letter
+        while len(self._domain_trail) > domain_mark:
+            entry, domain = self._domain_trail.pop()
+            entry.domain = domain
+        while len(self._used_trail) > used_mark:
+            length, used_mask = self._used_trail.pop()
+            self.used_masks[length] = used_mask
+        self.release(checkpoint_id)
+
+    # Keeps the changes made since the checkpoint was opened, and closes it
+    # along with any checkpoints opened after it.
+    def release(self, checkpoint_id: int) -> None:
+        del self._checkpoints[checkpoint_id:]
+        if not self._checkpoints:
+            self._letter_trail.clear()
+            self._domain_trail.clear()
+            self._used_trail.clear()
+
+    # Returns the complete entries whose answer already appears in an
+    # earlier entry.
+    def get_duplicate_entries(self) -> List[Entry]:
+        seen_answers = set()
+        duplicate_entries = []
+        for entry in self.entry_list:
+            if not entry.is_complete():
+                continue
+            answer = entry.get_current_hint()
+            if answer in seen_answers:
+                duplicate_entries.append(entry)
+            seen_answers.add(answer)
+        return duplicate_entries
+
     # Returns a list of invalid entries
     def validate_puzzle(self, word_filler: WordFiller) -> List[Entry]:
         invalid_entries = []
@@ -207,37 +549,46 @@ class Puzzle:
 
     def export_as_ascii(self, outfile: str):
         with open(outfile, "w") as f:
-            f.writelines([
-                str(self.rows) + "\n",
-                str(self.cols) + "\n",
-                self.title + "\n",
-                self.author + "\n",
-                self.copyright + "\n",
-                self.note + "\n",
-            ])
-
-            puzzle_ascii = ""
-            for r in range(self.rows):
-                for c in range(self.cols):
-                    sq = self.grid[r][c]
-                    if sq.is_black:
-                        puzzle_ascii += "*"
-                    elif sq.letter is None:
-                        puzzle_ascii += "-"
-                    else:
-                        puzzle_ascii += sq.letter
-                puzzle_ascii += "\n"
-
-            f.write(puzzle_ascii)
-
-            for entry in self.entries.values():
-                f.write(entry.clue_str() + "\n")
+            f.write(self.to_ascii())
+
+    def to_ascii(self) -> str:
+        lines = [
+            str(self.rows),
+            str(self.cols),
+            self.title,
+            self.author,
+            self.copyright,
+            self.note,
+        ]
+
+        cells = self.get_solution_bytes().replace(b".", b"*").decode("latin-1")
+        for r in range(self.rows):
+            lines.append(cells[r * self.cols:(r + 1) * self.cols])
+
+        for entry in self.entries.values():
+            lines.append(entry.clue_str())
+
+        lines.append("")
+        return "\n".join(lines)
+
+    # The letters row by row as in a .puz solution: "." for black squares
+    # and "-" for empty ones.
+    def get_solution_bytes(self) -> bytes:
+        cells = self.letters.replace(b".", b"-")
+        for cell, is_black in enumerate(self.black):
+            if is_black:
+                cells[cell] = ord(".")
+        return bytes(cells)
 
     @staticmethod
     def import_from_ascii(infile: str) -> 'Puzzle':
         with open(infile, "r") as f:
             puzzle_ascii = f.read()
 
+        return Puzzle.from_ascii(puzzle_ascii)
+
+    @staticmethod
+    def from_ascii(puzzle_ascii: str) -> 'Puzzle':
         lines = puzzle_ascii.splitlines()
         rows = int(lines[0])
         cols = int(lines[1])
@@ -248,7 +599,7 @@ class Puzzle:
         puzzle.copyright = lines[4]
         puzzle.note = lines[5]
 
-        for r, line in enumerate(lines[6:6+cols]):
+        for r, line in enumerate(lines[6:6+rows]):
             for c, letter in enumerate(line):
                 if letter == "*":
                     puzzle.mark_black_square((r, c))
@@ -258,12 +609,19 @@ class Puzzle:
         puzzle.initialize()
 
         # read in clues
-        for clue_str in lines[6+cols:]:
+        for clue_str in lines[6+rows:]:
             index_str = Entry.index_from_clue_str(clue_str)
             puzzle.entries[index_str].unmarshal_clue_str(clue_str)
 
         return puzzle
 
+    # Replaces every letter of the grid with a copy of `letters` taken
+    # earlier, and recomputes the domains if they are tracked.
+    def restore_letters(self, letters: bytes) -> None:
+        self.letters[:] = letters
+        if self.domain_word_filler is not None:
+            self.init_domains(self.domain_word_filler, self.exclude_used_words)
+
     def render(self):
         for i, row in enumerate(self.grid):
             row_str = ""
@@ -299,26 +657,8 @@ class Puzzle:
         result.title = self.title
         result.notes = self.note
 
-        solution_cells = []
-        fill_cells = []
-        for row in self.grid:
-            for cell in row:
-                solution_value = None
-                fill_value = None
-                if cell.is_black:
-                    solution_value = '.'
-                    fill_value = '.'
-                elif cell.letter is None:
-                    solution_value = '-'
-                    fill_value = '-'
-                else:
-                    solution_value = cell.letter
-                    fill_value = cell.letter
-
-                solution_cells.append(solution_value)
-                fill_cells.append(fill_value)
-        result.solution = ''.join(solution_cells)
-        result.fill = ''.join(fill_cells)
+        result.solution = self.get_solution_bytes().decode("latin-1")
+        result.fill = result.solution
 
         result.clues = []
         clues = collections.defaultdict(list)
@@ -0,0 +1,303 @@
+"""Stores many puzzles in one file as length-prefixed records that can be streamed."""
+import os
+import struct
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+from puzzle import Puzzle
+
+ARCHIVE_EXTENSION = ".xwarc"
+ARCHIVE_MAGIC = b"XWARC\0\x01\0"
+
+# An archive is ARCHIVE_MAGIC followed by records, each a little-endian
+# uint32 byte count and then:
+#   rows, cols, number of clues, puzzle id length   4 x uint16
+#   puzzle id                                       UTF-8
+#   solution                                        rows * cols bytes
+#   title, author, copyright, clues, note           NUL-terminated Latin-1
+# The solution and the strings are laid out exactly like in a .puz file,
+# so records convert to and from .puz bytes by slicing, without a Puzzle.
+_LENGTH = struct.Struct("<I")
+_RECORD_HEADER = struct.Struct("<HHHH")
+
+# .puz header fields, as written by puz.Puzzle.tobytes
+_PUZ_HEADER = struct.Struct("<H11sxHQ4s2sH12sBBHHH")
+_PUZ_HEADER_CHECKSUM = struct.Struct("<BBHHH")
+_PUZ_MAGIC = b"ACROSS&DOWN\0"
+_PUZ_MASK = b"ICHEATED"
+_PUZ_VERSION = b"1.3\0"
+_PUZ_TYPE_NORMAL = 0x0001
+_PUZ_SOLUTION_UNLOCKED = 0x0000
+_PUZ_SOLUTION_SCRAMBLED = 0x0004
+_PUZ_ENCODING = "latin-1"
+
+# .puz solution byte -> Puzzle.letters byte
+_LETTERS_TABLE = bytes.maketrans(b"-", b".")
+# .puz solution byte -> 1 if black, else 0
+_BLACK_TABLE = bytes(1 if byte == ord(".") else 0 for byte in range(256))
+
+
+# One archived puzzle. Fields are decoded from the record bytes on access,
+# so scanning an archive for ids or grids doesn't decode the clues.
+@dataclass
+class ArchiveRecord:
+    # the record without its length prefix
+    data: bytes
+
+    @property
+    def rows(self) -> int:
+        return _RECORD_HEADER.unpack_from(self.data)[0]
+
+    @property
+    def cols(self) -> int:
+        return _RECORD_HEADER.unpack_from(self.data)[1]
+
+    @property
+    def puzzle_id(self) -> str:
+        id_length = _RECORD_HEADER.unpack_from(self.data)[3]
+        return self.data[_RECORD_HEADER.size:_RECORD_HEADER.size + id_length].decode("utf-8")
+
+    # The solution in the .puz format: "." for black squares and "-" for
+    # empty ones.
+    @property
+    def cells(self) -> bytes:
+        start = self._get_solution_start()
+        return self.data[start:start + self.rows * self.cols]
+
+    def to_puzzle(self) -> Puzzle:
+        rows, cols, num_clues, _ = _RECORD_HEADER.unpack_from(self.data)
+        cells = self.cells
+        puzzle = Puzzle(rows, cols)
+        puzzle.black[:] = cells.translate(_BLACK_TABLE)
+        puzzle.initialize()
+        puzzle.letters[:] = cells.translate(_LETTERS_TABLE)
+        if len(puzzle.entry_list) != num_clues:
+            raise ValueError(
+                f"{self.puzzle_id}: {num_clues} clues for {len(puzzle.entry_list)} entries"
+            )
+
+        strings = [s.decode(_PUZ_ENCODING) for s in self._get_text().split(b"\0")]
+        puzzle.title, puzzle.author, puzzle.copyright = strings[:3]
+        puzzle.note = strings[3 + num_clues]
+        for entry, clue in zip(puzzle.entry_list, strings[3:3 + num_clues]):
+            entry.clue = clue or None
+        return puzzle
+
+    # Builds the same bytes as Puzzle.write_to_puz_file would write for
+    # the puzzle, without building it.
+    def to_puz_bytes(self) -> bytes:
+        rows, cols, num_clues, _ = _RECORD_HEADER.unpack_from(self.data)
+        solution = self.cells
+        text = self._get_text()
+
+        header_checksum = _puz_checksum(
+            _PUZ_HEADER_CHECKSUM.pack(cols, rows, num_clues, _PUZ_TYPE_NORMAL, _PUZ_SOLUTION_UNLOCKED)
+        )
+        solution_checksum = _puz_checksum(solution)
+        strings = text.split(b"\0")
+        # Puzzle.to_puz_puzzle fills the grid in with the solution
+        global_checksum = _puz_text_checksum(
+            strings,
+            num_clues,
+            _puz_checksum(solution, _puz_checksum(solution, header_checksum)),
+        )
+        magic_checksum = _puz_magic_checksum([
+            header_checksum,
+            solution_checksum,
+            solution_checksum,
+            _puz_text_checksum(strings, num_clues),
+        ])
+        header = _PUZ_HEADER.pack(
+            global_checksum,
+            _PUZ_MAGIC[:-1],
+            header_checksum,
+            magic_checksum,
+            _PUZ_VERSION,
+            b"\0\0",
+            0,
+            b"\0" * 12,
+            cols,
+            rows,
+            num_clues,
+            _PUZ_TYPE_NORMAL,
+            _PUZ_SOLUTION_UNLOCKED,
+        )
+        return b"".join([header, solution, solution, text])
+
+    def _get_solution_start(self) -> int:
+        return _RECORD_HEADER.size + _RECORD_HEADER.unpack_from(self.data)[3]
+
+    def _get_text(self) -> bytes:
+        return self.data[self._get_solution_start() + self.rows * self.cols:]
+
+
+def record_from_puzzle(puzzle: Puzzle, puzzle_id: str) -> ArchiveRecord:
+    id_bytes = puzzle_id.encode("utf-8")
+    strings = [puzzle.title, puzzle.author, puzzle.copyright]
+    strings += [entry.clue or "" for entry in puzzle.entry_list]
+    strings.append(puzzle.note)
+    return ArchiveRecord(b"".join([
+        _RECORD_HEADER.pack(puzzle.rows, puzzle.cols, len(puzzle.entry_list), len(id_bytes)),
+        id_bytes,
+        puzzle.get_solution_bytes(),
+        "\0".join(strings).encode(_PUZ_ENCODING),
+        b"\0",
+    ]))
+
+
+# Reads the solution and strings out of .puz file contents, dropping the
+# player's fill and any extra sections (rebus squares, circles, ...).
+def record_from_puz_bytes(data: bytes, puzzle_id: str) -> ArchiveRecord:
+    solution_start, rows, cols, num_clues = _read_puz_header(data, puzzle_id)
+    num_cells = rows * cols
+    text_start = solution_start + 2 * num_cells
+    # the strings end at the NUL after the note; anything after it is
+    # extra sections
+    strings = data[text_start:].split(b"\0", num_clues + 4)
+    if len(strings) < num_clues + 5:
+        raise ValueError(f"{puzzle_id}: truncated .puz file")
+    text_end = len(data) - len(strings[-1])
+
+    id_bytes = puzzle_id.encode("utf-8")
+    return ArchiveRecord(b"".join([
+        _RECORD_HEADER.pack(rows, cols, num_clues, len(id_bytes)),
+        id_bytes,
+        data[solution_start:solution_start + num_cells],
+        data[text_start:text_end],
+    ]))
+
+
+# Returns (rows, cols, solution) of .puz file contents, without reading
+# anything past the solution.
+def read_puz_solution(data: bytes, puzzle_id: str) -> Tuple[int, int, bytes]:
+    solution_start, rows, cols, _ = _read_puz_header(data, puzzle_id)
+    return rows, cols, data[solution_start:solution_start + rows * cols]
+
+
+# Returns (solution start, rows, cols, number of clues).
+def _read_puz_header(data: bytes, puzzle_id: str) -> Tuple[int, int, int, int]:
+    header_start = data.find(_PUZ_MAGIC) - 2
+    if header_start < 0:
+        raise ValueError(f"{puzzle_id}: not a .puz file")
+    fields = _PUZ_HEADER.unpack_from(data, header_start)
+    cols, rows, num_clues = fields[8:11]
+    if fields[12] == _PUZ_SOLUTION_SCRAMBLED:
+        raise ValueError(f"{puzzle_id}: scrambled .puz solutions aren't supported")
+    return header_start + _PUZ_HEADER.size, rows, cols, num_clues
+
+
+# Appends records to an archive, creating it if needed. With buffering=0
+# every record goes out in a single write as soon as it's written, so a
+# process that is killed leaves only whole records behind it.
+class ArchiveWriter:
+    path: str
+    file: BinaryIO
+
+    def __init__(self, path: str, buffering: int = -1):
+        self.path = path
+        self.file = open(path, "ab", buffering=buffering)
+        if self.file.tell() == 0:
+            self.file.write(ARCHIVE_MAGIC)
+        else:
+            with open(path, "rb") as f:
+                if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                    self.file.close()
+                    raise ValueError(f"{path} is not a puzzle archive")
+
+    def write_puzzle(self, puzzle: Puzzle, puzzle_id: str) -> None:
+        self.write_record(record_from_puzzle(puzzle, puzzle_id))
+
+    def write_record(self, record: ArchiveRecord) -> None:
+        self.file.write(_LENGTH.pack(len(record.data)) + record.data)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# Yields the records of an archive one at a time, reading as it goes.
+def read_archive(path: str) -> Iterator[ArchiveRecord]:
+    with open(path, "rb") as f:
+        yield from read_archive_stream(f, path)
+
+
+def read_archive_stream(f: BinaryIO, name: Optional[str] = None) -> Iterator[ArchiveRecord]:
+    name = name or getattr(f, "name", "archive")
+    if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+        raise ValueError(f"{name} is not a puzzle archive")
+    while True:
+        length_bytes = f.read(_LENGTH.size)
+        if not length_bytes:
+            return
+        if len(length_bytes) < _LENGTH.size:
+            raise ValueError(f"{name}: truncated record")
+        length, = _LENGTH.unpack(length_bytes)
+        data = f.read(length)
+        if len(data) < length:
+            raise ValueError(f"{name}: truncated record")
+        yield ArchiveRecord(data)
+
+
+# Yields the given files, and the files directly inside the given
+# directories in name order.
+def iter_puzzle_files(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for filename in sorted(os.listdir(path)):
+            file_path = os.path.join(path, filename)
+            if os.path.isfile(file_path):
+                yield file_path
+
+
+# Reads .puz files, archives and ASCII (Puzzle.import_from_ascii) files,
+# or every such file in the given directories. Puzzles other than archived
+# ones are named after their files.
+def read_records(paths: Iterable[str]) -> Iterator[ArchiveRecord]:
+    for file_path in iter_puzzle_files(paths):
+        puzzle_id, extension = os.path.splitext(os.path.basename(file_path))
+        if extension == ".puz":
+            with open(file_path, "rb") as f:
+                yield record_from_puz_bytes(f.read(), puzzle_id)
+        elif extension == ARCHIVE_EXTENSION:
+            yield from read_archive(file_path)
+        else:
+            yield record_from_puzzle(Puzzle.import_from_ascii(file_path), puzzle_id)
+
+
+# The .puz checksum: rotate right by one bit, then add the next byte.
+def _puz_checksum(data: bytes, checksum: int = 0) -> int:
+    for byte in data:
+        checksum = ((checksum >> 1) | ((checksum & 1) << 15)) + byte & 0xFFFF
+    return checksum
+
+
+# Checksums the title, author, copyright, clues and note the way
+# puz.Puzzle.text_cksum does: empty strings are skipped, and all but the
+# clues include their NUL.
+def _puz_text_checksum(strings, num_clues: int, checksum: int = 0) -> int:
+    for s in strings[:3]:
+        if s:
+            checksum = _puz_checksum(s + b"\0", checksum)
+    for clue in strings[3:3 + num_clues]:
+        if clue:
+            checksum = _puz_checksum(clue, checksum)
+    note = strings[3 + num_clues]
+    if note:
+        checksum = _puz_checksum(note + b"\0", checksum)
+    return checksum
+
+
+def _puz_magic_checksum(checksums) -> int:
+    magic_checksum = 0
+    for i in reversed(range(len(checksums))):
+        magic_checksum <<= 8
+        magic_checksum |= _PUZ_MASK[i] ^ (checksums[i] & 0xFF)
+        magic_checksum |= (_PUZ_MASK[i + 4] ^ (checksums[i] >> 8)) << 32
+    return magic_checksum
@@ -1,52 +1,290 @@
 """Util class containing logic to fill words."""
+import random
 from collections import Counter
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
+from candidate_scorer import CandidateScorer, ScoreFunction
+from csp_solver import CSPSolver, FillResult
 from entry import Entry
+from fill_budget import FillBudget, FillProgress
+from instrumentation import Tracer
 from puzzle import Puzzle
 from square import Square
-from word_filler import WordFiller
+from word_filler import MatchBackend, WordFiller
+from word_list_cache import WordListFilter
 
 
 class PuzzleFiller:
     word_filler: WordFiller
+    # also orders the backtracking fill's restarts
+    seed: Optional[int]
+    # scores the candidates of the heuristic fills
+    candidate_scorer: CandidateScorer
+    # shared with word_filler
+    tracer: Tracer
+    # whether fills may place the same answer in more than one entry
+    allow_duplicate_answers: bool
 
-    def __init__(self, words_file: str = "wordlist.txt"):
-        self.word_filler = WordFiller(words_file)
+    def __init__(
+        self,
+        words_file: Union[str, Sequence[str]] = "wordlist.txt",
+        seed: Optional[int] = None,
+        min_score: Optional[int] = None,
+        candidate_width: Optional[int] = 30,
+        lookahead_depth: int = 1,
+        score_function: str = ScoreFunction.BLEND,
+        match_backend: str = MatchBackend.BITSET,
+        tracer: Optional[Tracer] = None,
+        word_filter: Optional[WordListFilter] = None,
+        allow_duplicate_answers: bool = False,
+    ):
+        self.word_filler = WordFiller(
+            words_file,
+            seed=seed,
+            min_score=min_score,
+            backend=match_backend,
+            tracer=tracer,
+            word_filter=word_filter,
+        )
+        self.seed = seed
+        self.tracer = self.word_filler.tracer
+        self.allow_duplicate_answers = allow_duplicate_answers
+        self.candidate_scorer = CandidateScorer(
+            self.word_filler,
+            width=candidate_width,
+            depth=lookahead_depth,
+            score_function=score_function,
+        )
+
+    # Fills the puzzle with the given strategy ("csp", "heuristic" or
+    # "backtracking") within a wall-clock and node budget. If the budget
+    # runs out, the fill is cancelled through cancel_check, or the strategy
+    # gives up, the puzzle is left with the best partial fill found: the
+    # one with the most entries filled in.
+    def fill_puzzle_anytime(
+        self,
+        puzzle: Puzzle,
+        strategy: str = "csp",
+        time_limit_seconds: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+        progress_callback: Optional[Callable[[FillProgress], None]] = None,
+        progress_interval: int = 100,
+        cancel_check: Optional[Callable[[], bool]] = None,
+    ) -> FillResult:
+        budget = FillBudget(
+            time_limit_seconds=time_limit_seconds,
+            max_nodes=max_nodes,
+            progress_callback=progress_callback,
+            progress_interval=progress_interval,
+            cancel_check=cancel_check,
+        )
+        if strategy == "csp":
+            result = self.fill_puzzle_using_csp(puzzle, budget=budget, keep_partial_fill=True)
+        elif strategy == "heuristic":
+            self.fill_puzzle_using_heuristic(puzzle, budget=budget)
+            result = FillResult(success=False, status="incomplete")
+        elif strategy == "backtracking":
+            self.fill_puzzle_using_backtracking(puzzle, budget=budget)
+            result = FillResult(success=False, status="incomplete")
+        else:
+            raise ValueError(f"Unknown fill strategy {strategy}")
+
+        result.num_failed_entries = len(puzzle.validate_puzzle(self.word_filler))
+        result.success = result.num_failed_entries == 0
+        if result.success:
+            result.status = "solved"
+        elif budget.exhausted_reason is not None:
+            result.status = budget.exhausted_reason
+        if strategy != "csp":
+            result.answers = {
+                entry.index_str(): entry.get_current_hint()
+                for entry in puzzle.entries.values()
+                if entry.is_complete()
+            }
+        result.nodes = max(result.nodes, budget.nodes)
+        result.elapsed_seconds = budget.get_elapsed_seconds()
+        budget.report_progress(len(result.answers))
+        return result
+
+    # Fills the puzzle with the constraint solver. Keyword arguments are
+    # passed on to CSPSolver.
+    def fill_puzzle_using_csp(self, puzzle: Puzzle, **solver_kwargs) -> FillResult:
+        solver_kwargs.setdefault("allow_duplicate_answers", self.allow_duplicate_answers)
+        with self.tracer.timer("fill_csp"):
+            result = CSPSolver(self.word_filler, **solver_kwargs).solve(puzzle)
+        if self.tracer.enabled:
+            self.tracer.count("placements", result.nodes)
+            self.tracer.count("backtracks", result.backtracks)
+            self.tracer.count("backjumps", result.backjumps)
+            self.tracer.event("fill_done", strategy="csp", status=result.status)
+        return result
+
+    # Fills just the incomplete entries among the given ones with the
+    # constraint solver, leaving every other letter of the grid locked in
+    # place. Entries that cross each other are solved together, seeded with
+    # the letters already in the grid; each connected group is solved on
+    # its own, under one shared budget. Groups that can't be filled are
+    # left as they were. Entries in previous_answers try those answers last
+    # (see CSPSolver.solve).
+    def fill_entries(
+        self,
+        puzzle: Puzzle,
+        entries: List[Entry],
+        time_limit_seconds: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+        previous_answers: Optional[Dict[str, str]] = None,
+    ) -> FillResult:
+        budget = FillBudget(time_limit_seconds=time_limit_seconds, max_nodes=max_nodes)
+        result = FillResult(success=True, status="solved")
+        open_entries = [entry for entry in entries if not entry.is_complete()]
+        with self.tracer.timer("fill_entries"):
+            for component in puzzle.get_connected_components(open_entries):
+                component_result = CSPSolver(
+                    self.word_filler,
+                    budget=budget,
+                    allow_duplicate_answers=self.allow_duplicate_answers,
+                ).solve(puzzle, component, previous_answers)
+                result.answers.update(component_result.answers)
+                result.nodes += component_result.nodes
+                result.backtracks += component_result.backtracks
+                result.backjumps += component_result.backjumps
+                if not component_result.success and result.success:
+                    result.success = False
+                    result.status = component_result.status
+        result.elapsed_seconds = budget.get_elapsed_seconds()
+        if self.tracer.enabled:
+            self.tracer.event("fill_done", strategy="fill_entries", status=result.status)
+        return result
+
+    # Continues a partial fill: fills the incomplete entries, keeping every
+    # letter already in the grid.
+    def resume_fill(
+        self,
+        puzzle: Puzzle,
+        time_limit_seconds: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+    ) -> FillResult:
+        return self.fill_entries(puzzle, puzzle.entry_list, time_limit_seconds, max_nodes)
+
+    # Clears the given (row, col) squares and the squares of the given
+    # entries ("1A", "5D", ...), then re-fills only the entries that lost
+    # letters, as fill_entries does. Cleared entries try their previous
+    # answers last, so the re-fill differs from the old fill wherever the
+    # grid allows. Where a group of them can't be re-filled, its previous
+    # letters are put back.
+    def refill_region(
+        self,
+        puzzle: Puzzle,
+        squares: Sequence[Tuple[int, int]] = (),
+        entry_index_strs: Sequence[str] = (),
+        time_limit_seconds: Optional[float] = None,
+        max_nodes: Optional[int] = None,
+    ) -> FillResult:
+        coordinates = list(squares)
+        for index_str in entry_index_strs:
+            coordinates += [
+                divmod(cell, puzzle.cols) for cell in puzzle.entries[index_str].get_cells()
+            ]
+        previous_letters = bytes(puzzle.letters)
+        previous_answers = {
+            entry.index_str(): entry.get_current_hint()
+            for entry in puzzle.entry_list
+            if entry.is_complete()
+        }
+        cleared_entries = puzzle.clear_squares(coordinates)
+        result = self.fill_entries(
+            puzzle,
+            cleared_entries,
+            time_limit_seconds,
+            max_nodes,
+            previous_answers,
+        )
+        if not result.success:
+            letters = bytearray(puzzle.letters)
+            for entry in cleared_entries:
+                if entry.is_complete():
+                    continue
+                for cell in entry.get_cells():
+                    letters[cell] = previous_letters[cell]
+            puzzle.restore_letters(letters)
+        return result
+
+    # Returns the number of iterations the fill took. Without a budget, the
+    # fill gives up after 10000 iterations. When a search runs out of
+    # choices, a bounded budget is spent on restarts in new entry orders. A
+    # fill that doesn't finish is left with the most entries it ever had
+    # filled in at once.
+    def fill_puzzle_using_backtracking(
+        self,
+        puzzle: Puzzle,
+        budget: Optional[FillBudget] = None,
+    ) -> int:
+        if budget is None:
+            budget = FillBudget(max_nodes=10000)
+        with self.tracer.timer("fill_backtracking"):
+            return self._fill_puzzle_using_backtracking(puzzle, budget)
 
-    def fill_puzzle_using_backtracking(self, puzzle: Puzzle) -> None:
+    def _fill_puzzle_using_backtracking(self, puzzle: Puzzle, budget: FillBudget) -> int:
+        tracer = self.tracer
+        tracing = tracer.enabled
+        puzzle.init_domains(
+            self.word_filler,
+            exclude_used_words=not self.allow_duplicate_answers,
+        )
         entries_list = puzzle.get_entries_sorted_by_length_asc()
-        choices_stack: List[Tuple[Entry, str, List[Square]]] = []
+        # (entry, answer, checkpoint opened just before placing the answer)
+        choices_stack: List[Tuple[Entry, str, int]] = []
+        fill_checkpoint_id = puzzle.checkpoint()
+
+        best_letters = bytes(puzzle.letters)
+        best_num_filled_entries = 0
+        restart_rng = random.Random(self.seed)
 
         entry_visit_counter = Counter()
         total_iterations = 0
         while len(entries_list) > 0:
-            print(len(entries_list))
             total_iterations += 1
-            if total_iterations > 10000:
-                print("I TRIED")
-                return
+            if not budget.spend_node(len(choices_stack)):
+                if tracing:
+                    tracer.event(
+                        "fill_done",
+                        strategy="backtracking",
+                        status=budget.exhausted_reason,
+                    )
+                puzzle.release(fill_checkpoint_id)
+                puzzle.restore_letters(best_letters)
+                return total_iterations
 
             entry = entries_list.pop()
-            chosen_answer, affected_squares = \
+            checkpoint_id = puzzle.checkpoint()
+            chosen_answer, _ = \
                 self.fill_entry_in_puzzle_using_heuristic(
                     puzzle,
                     entry,
                     entry_visit_counter[entry],
+                    forward_checking=True,
                 )
             entry_visit_counter[entry] += 1
 
             # we've reached a dead-end. Backtrack.
             if chosen_answer == "":
+                if tracing:
+                    tracer.count("backtracks")
+                    tracer.event(
+                        "backtrack",
+                        entry=entry.index_str(),
+                        num_open_entries=len(entries_list) + 1,
+                    )
+                puzzle.release(checkpoint_id)
                 found_previous_intersecting_entry = False
                 entries_list.append(entry)
                 # reset the entry_visit_counter because we will hopefully
                 # be filling the entry using a different hint the next time.
                 entry_visit_counter[entry] = 0
 
-                while not found_previous_intersecting_entry:
-                    prev_entry, prev_answer, prev_affected_squares = choices_stack.pop()
-                    puzzle.erase_squares(prev_affected_squares)
+                while not found_previous_intersecting_entry and choices_stack:
+                    prev_entry, prev_answer, prev_checkpoint_id = choices_stack.pop()
+                    puzzle.rollback(prev_checkpoint_id)
                     entries_list.append(prev_entry)
 
                     if prev_entry.intersects_with(entry):
@@ -54,11 +292,41 @@ class PuzzleFiller:
                     else:
                         entry_visit_counter[prev_entry] -= 1
 
+                if not found_previous_intersecting_entry:
+                    # every choice has been undone; nothing is left to try
+                    # in this order
+                    if not budget.is_bounded():
+                        if tracing:
+                            tracer.event(
+                                "fill_done",
+                                strategy="backtracking",
+                                status="unsatisfiable",
+                            )
+                        puzzle.release(fill_checkpoint_id)
+                        puzzle.restore_letters(best_letters)
+                        return total_iterations
+                    # Spend the rest of the budget on restarts that take the
+                    # entries of each length in a new random order, keeping
+                    # the best fill of any of them.
+                    if tracing:
+                        tracer.count("restarts")
+                        tracer.event("restart", strategy="backtracking")
+                    entries_list = sorted(
+                        puzzle.entry_list,
+                        key=lambda entry: (entry.answer_length, restart_rng.random()),
+                    )
+                    entry_visit_counter.clear()
+
                 continue
 
-            choices_stack.append((entry, chosen_answer, affected_squares))
-        print("DONE?!")
-        return
+            choices_stack.append((entry, chosen_answer, checkpoint_id))
+            if len(choices_stack) > best_num_filled_entries:
+                best_num_filled_entries = len(choices_stack)
+                best_letters = bytes(puzzle.letters)
+        puzzle.release(fill_checkpoint_id)
+        if tracing:
+            tracer.event("fill_done", strategy="backtracking", status="solved")
+        return total_iterations
 
     # Returns a tuple of the chosen answer as well as the squares
     # newly affected by filling in that answer
@@ -72,91 +340,125 @@ class PuzzleFiller:
 
         # we've exhausted all possible matches for this entry; fail.
         if visit_number > 20 or len(possible_matches) <= visit_number:
-            print(f"COULDN'T FIND VIABLE MATCH FOR {entry.index_str()}")
+            if self.tracer.enabled:
+                self.tracer.event("no_viable_match", entry=entry.index_str())
             return "", []
 
         next_answer_to_try = possible_matches[visit_number]
-        print(f"NEXT ANSWER TO TRY IS {next_answer_to_try}")
+        if self.tracer.enabled:
+            self.tracer.count("placements")
+            self.tracer.event("place", entry=entry.index_str(), answer=next_answer_to_try)
         newly_affected_squares = puzzle.fill_entry(entry, next_answer_to_try)
-
-        puzzle.fill_entry(entry, next_answer_to_try)
         return next_answer_to_try, newly_affected_squares
 
-    def fill_puzzle_using_heuristic(self, puzzle: Puzzle) -> Tuple[int, int]:
+    # Returns the number of entries filled in and the number of entries
+    # that couldn't be. With a budget, stops filling once it runs out.
+    def fill_puzzle_using_heuristic(
+        self,
+        puzzle: Puzzle,
+        budget: Optional[FillBudget] = None,
+    ) -> Tuple[int, int]:
+        with self.tracer.timer("fill_heuristic"):
+            return self._fill_puzzle_using_heuristic(puzzle, budget)
+
+    def _fill_puzzle_using_heuristic(
+        self,
+        puzzle: Puzzle,
+        budget: Optional[FillBudget],
+    ) -> Tuple[int, int]:
         failed_words_count = 0
         success_words_count = 0
-        entries_list = puzzle.get_entries_sorted_by_fill_priority_desc(self.word_filler)
-        while len(entries_list) > 0:
-            entry = entries_list[0]
-            res, _ = self.fill_entry_in_puzzle_using_heuristic(puzzle, entry, 0)
+        puzzle.init_domains(
+            self.word_filler,
+            exclude_used_words=not self.allow_duplicate_answers,
+        )
+        entries_queue = puzzle.get_fill_priority_queue(self.word_filler)
+        while len(entries_queue) > 0:
+            if budget is not None and not budget.spend_node(success_words_count):
+                break
+            entry = entries_queue.peek()
+            res, affected_squares = self.fill_entry_in_puzzle_using_heuristic(puzzle, entry, 0)
             if res == "":
                 failed_words_count += 1
+                entries_queue.remove(entry)
             else:
                 success_words_count += 1
 
-            entries_list = puzzle.get_entries_sorted_by_fill_priority_desc(self.word_filler)
-            print("LENGTH OF ENTRIES LIST:", len(entries_list))
+            # only the filled entry, the entries crossing the newly filled
+            # squares and the entries that lost the new answers from their
+            # domains can have a different priority now
+            affected_entries = puzzle.get_entries_for_squares(affected_squares) + [entry]
+            if res != "":
+                affected_entries += puzzle.excluded_word_entries
+            for affected_entry in affected_entries:
+                entries_queue.update(
+                    affected_entry,
+                    affected_entry.get_fill_priority(self.word_filler),
+                )
+        if self.tracer.enabled:
+            self.tracer.event(
+                "fill_done",
+                strategy="heuristic",
+                num_filled=success_words_count,
+                num_failed=failed_words_count,
+            )
         return success_words_count, failed_words_count
 
+    # Picks the best of the entry's candidates, as ranked by
+    # candidate_scorer (by default the first 30 candidates, scored by the
+    # domain sizes they leave their crossing entries with). With
+    # forward_checking, candidates that would leave a crossing entry
+    # without any candidates are never chosen. Starts tracking domains if
+    # the puzzle doesn't yet.
     def fill_entry_in_puzzle_using_heuristic(
         self,
         puzzle: Puzzle,
         entry: Entry,
         visit_number: int,
+        forward_checking: bool = False,
     ) -> Tuple[str, List[Square]]:
-        possible_matches = entry.get_possible_matches(self.word_filler)
-        if len(possible_matches) == 0:
+        if puzzle.domain_word_filler is None:
+            puzzle.init_domains(
+                self.word_filler,
+                exclude_used_words=not self.allow_duplicate_answers,
+            )
+        scored_candidates = self.candidate_scorer.score_candidates(puzzle, entry)
+        if len(scored_candidates) == 0:
             return "", []
 
-        answers_with_scores_and_affected_squares = {}
-
-        # maybe i need to do two rounds (i.e., go deeper :()
-        for i in range(min(len(possible_matches), 30)):
-            random_answer = possible_matches[i]
-            newly_affected_squares = puzzle.fill_entry(entry, random_answer)
-            newly_affected_entries = \
-                set([puzzle.entries[sq.down_entry_parent] for sq in newly_affected_squares]).union(
-                    set([puzzle.entries[sq.across_entry_parent] for sq in newly_affected_squares])
-                ).difference({entry})
-
-            # TODO(kevin): change heuristic to account for more than just 1 entry?
-            num_matches = []
-            for newly_affected_entry in newly_affected_entries:
-                possible_matches_for_entry = newly_affected_entry.get_possible_matches(self.word_filler)
-                num_matches.append(len(possible_matches_for_entry))
-            num_matches.sort()
-
-            fill_score = 1000
-            if len(num_matches) == 0:
-                fill_score = 999
-            elif len(num_matches) == 1:
-                fill_score = num_matches[0]
-            elif num_matches[0] == 0:
-                fill_score = 0
-            else:
-                fill_score = num_matches[0]*0.8 + num_matches[1]*0.2
-
-            answers_with_scores_and_affected_squares[random_answer] = \
-                (fill_score, newly_affected_squares)
+        if forward_checking:
+            scored_candidates = [
+                candidate for candidate in scored_candidates if candidate.is_viable
+            ]
+        answers_with_scores = {
+            candidate.answer: candidate.score for candidate in scored_candidates
+        }
 
-            # reset the puzzle for the next iteration
-            puzzle.erase_squares(newly_affected_squares)
-
-        # sort answers by score
-        sorted_answers = list(answers_with_scores_and_affected_squares.keys())
-        sorted_answers.sort(key=lambda a: answers_with_scores_and_affected_squares[a][0], reverse=True)
+        # sorted by score
+        sorted_answers = list(answers_with_scores.keys())
         best_answer = sorted_answers[visit_number] if visit_number < len(sorted_answers) else ""
         if best_answer == "":
-            print("TOO MANY VISITS")
+            if self.tracer.enabled:
+                self.tracer.event("no_viable_match", entry=entry.index_str())
             return "", []
 
-        fill_score = answers_with_scores_and_affected_squares[best_answer][0]
-        affected_squares = answers_with_scores_and_affected_squares[best_answer][1]
-
-        print(
-            f"BEST ANSWER for {entry.index_str()} IS {best_answer} "
-            f"with a fill score of {fill_score}",
-        )
+        if self.tracer.enabled:
+            self.tracer.count("placements")
+            self.tracer.event(
+                "place",
+                entry=entry.index_str(),
+                answer=best_answer,
+                fill_score=answers_with_scores[best_answer],
+            )
 
-        puzzle.fill_entry(entry, best_answer)
+        affected_squares = puzzle.fill_entry(entry, best_answer)
         return best_answer, affected_squares
+
+
+# Fill strategy name -> the PuzzleFiller method that fills a whole puzzle
+# with it.
+FILL_STRATEGIES: Dict[str, Callable[[PuzzleFiller, Puzzle], object]] = {
+    "heuristic": PuzzleFiller.fill_puzzle_using_heuristic,
+    "backtracking": PuzzleFiller.fill_puzzle_using_backtracking,
+    "csp": PuzzleFiller.fill_puzzle_using_csp,
+}
@@ -1,17 +1,98 @@
 """Class representing the a single square in the crossword grid."""
-from dataclasses import dataclass
 from typing import Optional
 
+# Letter byte stored for a square without a letter.
+EMPTY_LETTER = ord(".")
 
-@dataclass
+
+# A view onto one cell of a puzzle's flat letter and black-square arrays.
+# Squares created on their own, like Square(is_black=True), get a private
+# single-cell storage. Squares still compare and print by their fields, as
+# they did when they held them directly.
 class Square:
-    is_black: bool = False
-    letter: Optional[str] = None
-    index: Optional[int] = None
-    starts_down_word: bool = False
-    starts_across_word: bool = False
-    across_entry_parent: Optional[str] = None
-    down_entry_parent: Optional[str] = None
+    __slots__ = (
+        "letters",
+        "black",
+        "cell",
+        "index",
+        "starts_down_word",
+        "starts_across_word",
+        "across_entry_parent",
+        "down_entry_parent",
+    )
+
+    def __init__(
+        self,
+        is_black: bool = False,
+        letter: Optional[str] = None,
+        index: Optional[int] = None,
+        starts_down_word: bool = False,
+        starts_across_word: bool = False,
+        across_entry_parent: Optional[str] = None,
+        down_entry_parent: Optional[str] = None,
+        *,
+        letters: Optional[bytearray] = None,
+        black: Optional[bytearray] = None,
+        cell: int = 0,
+    ):
+        self.letters = letters if letters is not None else bytearray([EMPTY_LETTER])
+        self.black = black if black is not None else bytearray(1)
+        self.cell = cell
+        # views keep what their storage already holds
+        if is_black:
+            self.is_black = True
+        if letter is not None:
+            self.letter = letter
+        self.index = index
+        self.starts_down_word = starts_down_word
+        self.starts_across_word = starts_across_word
+        self.across_entry_parent = across_entry_parent
+        self.down_entry_parent = down_entry_parent
+
+    def _get_fields(self) -> tuple:
+        return (
+            self.is_black,
+            self.letter,
+            self.index,
+            self.starts_down_word,
+            self.starts_across_word,
+            self.across_entry_parent,
+            self.down_entry_parent,
+        )
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._get_fields() == other._get_fields()
+
+    # squares are mutable, so like the dataclass they aren't hashable
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return (
+            f"Square(is_black={self.is_black!r}, letter={self.letter!r}, "
+            f"index={self.index!r}, starts_down_word={self.starts_down_word!r}, "
+            f"starts_across_word={self.starts_across_word!r}, "
+            f"across_entry_parent={self.across_entry_parent!r}, "
+            f"down_entry_parent={self.down_entry_parent!r})"
+        )
+
+    @property
+    def is_black(self) -> bool:
+        return self.black[self.cell] == 1
+
+    @is_black.setter
+    def is_black(self, is_black: bool) -> None:
+        self.black[self.cell] = 1 if is_black else 0
+
+    @property
+    def letter(self) -> Optional[str]:
+        letter = self.letters[self.cell]
+        return None if letter == EMPTY_LETTER else chr(letter)
+
+    @letter.setter
+    def letter(self, letter: Optional[str]) -> None:
+        self.letters[self.cell] = EMPTY_LETTER if letter is None else ord(letter)
 
     # Example of one square rendered:
     # +—————+
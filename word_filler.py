@@ -1,51 +1,386 @@
 """Util class containing logic to fill words."""
 import random
-import re
-from typing import Dict, List, Set
+from collections import OrderedDict
+from itertools import groupby
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+from instrumentation import NULL_TRACER, Tracer
+from word_list_cache import WordListFilter, build_letter_index, load_or_compile, read_word_list
+
+# Of the matching code, only the NumPy match backend needs NumPy (see
+# requirements.txt); asking for it without NumPy raises ImportError.
+try:
+    from letter_matrix import LetterMatrix, row_mask_to_bitset
+except ImportError:
+    LetterMatrix = row_mask_to_bitset = None
+
+
+class MatchBackend:
+    # AND together the letter_index bitsets of the hint's letters
+    BITSET = "bitset"
+    # compare the columns of a NumPy letter matrix per length bucket
+    NUMPY = "numpy"
 
 
 class WordFiller:
-    words_file: str
-    words_by_length: Dict[int, List[str]]
-    words_set: Set[str]
+    # one word list, or several merged into one dictionary
+    words_file: Union[str, Sequence[str]]
+    # words dropped while loading; unlike min_score they can't be let back in
+    word_filter: Optional[WordListFilter]
+    words_by_length: Mapping[int, List[str]]
+    # scores aligned with words_by_length. In scored word lists every
+    # length bucket is sorted by descending score.
+    scores_by_length: Mapping[int, Sequence[int]]
+    is_scored: bool
+    # words scoring below this are left out of every candidate bitset
+    min_score: Optional[int]
+    # length -> number of words of that length
+    length_sizes: Dict[int, int]
+    # length -> position -> letter -> bitset over words_by_length[length].
+    # Bit i is set iff words_by_length[length][i][position] == letter.
+    letter_index: Mapping[int, List[Dict[str, int]]]
+    # length -> word id that candidate lists start from. Every process picks
+    # its own offsets (or derives them from seed), so fills differ from run
+    # to run even though the dictionary order itself is fixed. Scored lists
+    # always start from the best word.
+    start_offsets: Dict[int, int]
+    # Scored lists only: length -> (first word id, end word id, offset) of
+    # every run of equally scored words. Candidates still come best score
+    # first, but each run starts from its own offset, picked like
+    # start_offsets, so that seeds break ties differently.
+    score_runs: Dict[int, List[Tuple[int, int, int]]]
+    # hint -> bitset of matching words, shared by every entry
+    pattern_cache: 'PatternCache'
+    # how hints are matched against the words; both backends produce the
+    # same bitsets
+    backend: str
+    # length -> LetterMatrix, built on first use by the NumPy backend
+    letter_matrices: Dict[int, 'LetterMatrix']
+    tracer: Tracer
 
-    def __init__(self, words_file: str = "wordlist.txt"):
+    def __init__(
+        self,
+        words_file: Union[str, Sequence[str]] = "wordlist.txt",
+        use_cache: bool = True,
+        seed: Optional[int] = None,
+        pattern_cache_bytes: int = 64 * 1024 * 1024,
+        min_score: Optional[int] = None,
+        backend: str = MatchBackend.BITSET,
+        tracer: Optional[Tracer] = None,
+        word_filter: Optional[WordListFilter] = None,
+    ):
+        assert backend in (MatchBackend.BITSET, MatchBackend.NUMPY), \
+            f"Unknown match backend {backend}"
+        if backend == MatchBackend.NUMPY and LetterMatrix is None:
+            raise ImportError("The numpy match backend requires numpy")
         self.words_file = words_file
-        
-        # read wordlist file into memory
-        with open(self.words_file, "r") as f:
-            words_str = f.read()
-            words_list = words_str.splitlines()
-        
-        # populate self.words_by_length
-        self.words_by_length = {}
-        self.words_set = set()
-
-        for word in words_list:
-            # represents a comment
-            if word.startswith("#"):
-                continue
-            self.words_by_length.setdefault(len(word), list()).append(word)
-            self.words_set.add(word)
+        self.word_filter = word_filter
+        self.backend = backend
+        self.letter_matrices = {}
+        self.tracer = tracer or NULL_TRACER
+        self._words_set = None
+        self.pattern_cache = PatternCache(pattern_cache_bytes)
+        self.min_score = min_score
+        self._full_masks = {}
+
+        with self.tracer.timer("word_filler_load"):
+            self._load(words_file, use_cache)
 
-        for k in self.words_by_length:
-            random.shuffle(self.words_by_length[k])
+        rng = random.Random(seed)
+        self.start_offsets = {
+            length: rng.randrange(size) if size > 0 and not self.is_scored else 0
+            for length, size in sorted(self.length_sizes.items())
+        }
+        self.score_runs = {}
+        if self.is_scored:
+            for length in sorted(self.length_sizes):
+                self.score_runs[length] = _get_score_runs(self.scores_by_length[length], rng)
 
-    # returns possible matches for the given hint, up to 1000 matches.
+    def _load(self, words_file: Union[str, Sequence[str]], use_cache: bool) -> None:
+        compiled = load_or_compile(words_file, self.word_filter) if use_cache else None
+        if compiled is not None:
+            self.words_by_length = compiled.words_by_length
+            self.scores_by_length = compiled.scores_by_length
+            self.is_scored = compiled.is_scored
+            self.letter_index = compiled.letter_index
+            self.length_sizes = {
+                length: sizes[0] for length, sizes in compiled.length_table.items()
+            }
+        else:
+            word_list = read_word_list(words_file, self.word_filter)
+            self.words_by_length = word_list.words_by_length
+            self.scores_by_length = word_list.scores_by_length
+            self.is_scored = word_list.is_scored
+            self.letter_index = build_letter_index(self.words_by_length)
+            self.length_sizes = {
+                length: len(words) for length, words in self.words_by_length.items()
+            }
+
+    @property
+    def words_set(self) -> Set[str]:
+        if self._words_set is None:
+            self._words_set = set()
+            for words in self.words_by_length.values():
+                self._words_set.update(words)
+        return self._words_set
+
+    # returns possible matches for the given hint, up to 2000 matches.
     # hint format: ".A..BC..D."
     def get_possible_words_for_hint(self, hint: str) -> List[str]:
-        matches = list()
+        return self.get_words_for_mask(
+            len(hint),
+            self.get_mask_for_hint(hint),
+            limit=2000,
+        )
+
+    # Returns the exact number of words matching the hint, or cap if more
+    # words than that match. No word lists are built.
+    def count_words_for_hint(self, hint: str, cap: Optional[int] = None) -> int:
+        num_matches = self.get_mask_for_hint(hint).bit_count()
+        if cap is not None:
+            return min(num_matches, cap)
+        return num_matches
+
+    # Returns a bitset over words_by_length[len(hint)] of the words matching
+    # the hint, leaving out the words set in exclude_mask. Costs one big-int
+    # AND per filled-in letter of the hint, or a dict lookup if the hint was
+    # seen recently, plus one AND to exclude words.
+    def get_mask_for_hint(self, hint: str, exclude_mask: int = 0) -> int:
+        if exclude_mask:
+            return self.get_mask_for_hint(hint) & ~exclude_mask
+
+        mask = self.pattern_cache.get(hint)
+        if mask is None:
+            mask = self._compute_mask_for_hint(hint)
+            self.pattern_cache.put(hint, mask)
+            if self.tracer.enabled:
+                self.tracer.count("pattern_queries")
+                self.tracer.count("pattern_cache_misses")
+        elif self.tracer.enabled:
+            self.tracer.count("pattern_queries")
+            self.tracer.count("pattern_cache_hits")
+        return mask
+
+    def _compute_mask_for_hint(self, hint: str) -> int:
+        word_len = len(hint)
+        if word_len not in self.letter_index:
+            return 0
+        if self.backend == MatchBackend.NUMPY:
+            return row_mask_to_bitset(self._get_row_mask_for_hint(hint))
+
+        mask = self.get_full_mask(word_len)
+        positions = self.letter_index[word_len]
+        for i, letter in enumerate(hint):
+            if letter == ".":
+                continue
+            mask &= positions[i].get(letter, 0)
+            if not mask:
+                return 0
+        return mask
+
+    # Returns a boolean row mask over words_by_length[len(hint)] of the
+    # words matching the hint, from the length's letter matrix.
+    def _get_row_mask_for_hint(self, hint: str):
         word_len = len(hint)
-        num_matches = 0
-        for word in self.words_by_length[word_len]:
-            if re.match(hint, word) is not None:
-                matches.append(word)
-                num_matches += 1
-                if num_matches >= 2000:
-                    break
-        return matches
+        if word_len not in self.letter_matrices:
+            self.letter_matrices[word_len] = LetterMatrix(
+                self.words_by_length[word_len],
+                word_len,
+            )
+        row_mask = self.letter_matrices[word_len].get_match_mask(hint)
+        # words below min_score are the tail of the bucket
+        row_mask[self.get_full_mask(word_len).bit_length():] = False
+        return row_mask
+
+    # Returns letter -> number of words matching the hint that have that
+    # letter at the given position, i.e. which letters a crossing entry
+    # can still put in that square, and how many ways.
+    def get_letter_counts_for_hint(self, hint: str, position: int) -> Dict[str, int]:
+        word_len = len(hint)
+        if word_len not in self.letter_index:
+            return {}
+        if self.backend == MatchBackend.NUMPY:
+            row_mask = self._get_row_mask_for_hint(hint)
+            return self.letter_matrices[word_len].get_letter_counts(row_mask, position)
+
+        mask = self.get_mask_for_hint(hint)
+        letter_counts = {}
+        for letter, letter_mask in self.letter_index[word_len][position].items():
+            num_matches = (mask & letter_mask).bit_count()
+            if num_matches > 0:
+                letter_counts[letter] = num_matches
+        return letter_counts
+
+    # Returns a bitset of the words of the given length that have the given
+    # letter at the given position.
+    def get_mask_for_letter(self, word_len: int, position: int, letter: str) -> int:
+        if word_len not in self.letter_index:
+            return 0
+        return self.letter_index[word_len][position].get(letter, 0)
+
+    # Returns a bitset with one bit set per word of the given length that
+    # meets min_score. Buckets of scored lists are sorted by descending
+    # score, so those words are always a prefix of the bucket.
+    def get_full_mask(self, word_len: int) -> int:
+        if word_len not in self._full_masks:
+            num_words = self.length_sizes.get(word_len, 0)
+            if self.min_score is not None and num_words > 0:
+                num_words = sum(
+                    1 for score in self.scores_by_length[word_len]
+                    if score >= self.min_score
+                )
+            self._full_masks[word_len] = (1 << num_words) - 1
+        return self._full_masks[word_len]
+
+    # Yields the ids of the words whose bits are set in mask, in candidate
+    # order, up to limit ids (no limit if None).
+    def iter_word_ids(self, word_len: int, mask: int, limit: int = None):
+        score_runs = self.score_runs.get(word_len)
+        if score_runs is not None:
+            yield from _iter_set_bits_in_runs(mask, score_runs, limit)
+            return
+
+        offset = self.start_offsets.get(word_len, 0)
+        if offset == 0:
+            yield from iter_set_bits(mask, limit)
+            return
+
+        # rotate the bitset so that word id `offset` comes first
+        size = self.length_sizes[word_len]
+        rotated_mask = (mask >> offset) | ((mask << (size - offset)) & ((1 << size) - 1))
+        for i in iter_set_bits(rotated_mask, limit):
+            yield i + offset if i < size - offset else i + offset - size
+
+    # Returns the words of the given length whose bits are set in mask,
+    # in candidate order, up to limit words (no limit if None).
+    def get_words_for_mask(
+        self,
+        word_len: int,
+        mask: int,
+        limit: int = None,
+    ) -> List[str]:
+        if not mask:
+            return []
+        words = self.words_by_length[word_len]
+        return [words[i] for i in self.iter_word_ids(word_len, mask, limit)]
 
     def contains_word(self, word: str) -> bool:
-        if word in self.words_set:
-            print(f"FOUND {word} in set!")
         return word in self.words_set
+
+
+@dataclass
+class PatternCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    num_patterns: int
+    size_bytes: int
+
+
+# LRU cache of hint -> bitset, bounded by the total size of the bitsets it
+# holds rather than by the number of hints, since a bitset for an open
+# 8-letter hint is thousands of times bigger than one for a nearly
+# complete hint.
+class PatternCache:
+    max_bytes: int
+    size_bytes: int
+    masks: 'OrderedDict[str, int]'
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.masks = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, hint: str) -> Optional[int]:
+        mask = self.masks.get(hint)
+        if mask is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.masks.move_to_end(hint)
+        return mask
+
+    def put(self, hint: str, mask: int) -> None:
+        mask_bytes = _get_mask_size_bytes(mask)
+        if mask_bytes > self.max_bytes:
+            return
+        if hint in self.masks:
+            self.size_bytes -= _get_mask_size_bytes(self.masks.pop(hint))
+        self.masks[hint] = mask
+        self.size_bytes += mask_bytes
+        while self.size_bytes > self.max_bytes:
+            _, evicted_mask = self.masks.popitem(last=False)
+            self.size_bytes -= _get_mask_size_bytes(evicted_mask)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.masks.clear()
+        self.size_bytes = 0
+
+    def get_stats(self) -> PatternCacheStats:
+        return PatternCacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            num_patterns=len(self.masks),
+            size_bytes=self.size_bytes,
+        )
+
+
+def _get_mask_size_bytes(mask: int) -> int:
+    return (mask.bit_length() + 7) // 8
+
+
+# Splits a descending score bucket into its runs of equal scores, as
+# (first word id, end word id, random offset into the run).
+def _get_score_runs(scores: Sequence[int], rng: random.Random) -> List[Tuple[int, int, int]]:
+    score_runs = []
+    start = 0
+    for _, run in groupby(scores):
+        end = start + sum(1 for _ in run)
+        score_runs.append((start, end, rng.randrange(end - start)))
+        start = end
+    return score_runs
+
+
+# Yields the indices of the set bits of mask run by run, each run from its
+# offset around to the index before it, stopping after limit indices if
+# limit is given.
+def _iter_set_bits_in_runs(mask: int, score_runs: List[Tuple[int, int, int]], limit: int = None):
+    if mask <= 0:
+        return
+    # as in iter_set_bits, one bin() and then str.find() per index
+    bits = bin(mask)[:1:-1]
+    found = 0
+    for start, end, offset in score_runs:
+        if start >= len(bits):
+            return
+        for run_start, run_end in ((start + offset, end), (start, start + offset)):
+            i = bits.find("1", run_start, run_end)
+            while i != -1:
+                yield i
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+                i = bits.find("1", i + 1, run_end)
+
+
+# Yields the indices of the set bits of mask in ascending order, stopping
+# after limit indices if limit is given.
+def iter_set_bits(mask: int, limit: int = None):
+    if mask <= 0:
+        return
+    # bin() and str.find() both run in C, so this costs one linear pass over
+    # the bitset plus a constant amount of work per yielded index.
+    bits = bin(mask)[:1:-1]
+    found = 0
+    i = bits.find("1")
+    while i != -1:
+        yield i
+        found += 1
+        if limit is not None and found >= limit:
+            return
+        i = bits.find("1", i + 1)
+
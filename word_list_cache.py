@@ -0,0 +1,452 @@
+"""Compiled, memory-mapped form of a word list and its letter index."""
+import hashlib
+import mmap
+import os
+import random
+import struct
+import tempfile
+from array import array
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Bump whenever the layout below, the word order or the parsing changes.
+CACHE_VERSION = 4
+CACHE_SUFFIX = ".xwcache"
+
+# Score given to the words of a list without scores, and to unscored lines
+# of a scored list.
+DEFAULT_SCORE = 50
+
+# Words within a length bucket are stored in a fixed pseudo-random order
+# rather than file (alphabetical) order, so the first candidates for a
+# pattern aren't all from the start of the alphabet. In scored lists the
+# buckets are then sorted by descending score.
+_WORD_ORDER_SEED = 0
+
+# File layout, all integers little-endian:
+#   header:        magic, version, sha256 of the source file, flags, #lengths
+#   length table:  per length: length, #words, words offset, words size,
+#                  scores offset, #index entries, index entries offset
+#   index entries: per (position, letter): position, letter code point,
+#                  offset of a bitset of ceil(#words / 8) bytes
+#   data:          "\n"-joined utf-8 words of each length, their native int32
+#                  scores, then the bitsets
+_MAGIC = b"XWGC"
+_HEADER = struct.Struct("<4sI32sII")
+_LENGTH_ENTRY = struct.Struct("<IIQQQIQ")
+_INDEX_ENTRY = struct.Struct("<HIQ")
+_FLAG_SCORED = 1
+
+
+@dataclass
+class WordList:
+    words_by_length: Dict[int, List[str]]
+    # scores, aligned with words_by_length
+    scores_by_length: Dict[int, array]
+    # whether any line of the list had a score
+    is_scored: bool
+    # lines that had a ";" but no valid "WORD;score" form, and were skipped
+    num_malformed_lines: int = 0
+
+
+# Words a list is narrowed to as it is read. Words failing the filter are
+# dropped before they are stored, so they cost nothing once loaded.
+@dataclass(frozen=True)
+class WordListFilter:
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    # the letters words may use, e.g. string.ascii_uppercase. None allows
+    # any letter a grid cell can hold.
+    charset: Optional[str] = None
+    min_score: Optional[int] = None
+
+    def accepts(self, word: str, score: int) -> bool:
+        if self.min_length is not None and len(word) < self.min_length:
+            return False
+        if self.max_length is not None and len(word) > self.max_length:
+            return False
+        if self.min_score is not None and score < self.min_score:
+            return False
+        # strip() only empties the word if every letter is in the charset
+        if self.charset is not None and word.strip(self.charset):
+            return False
+        return True
+
+
+# Reads one or more word lists into length buckets, skipping comment lines
+# and words that don't fit the grid's one-byte (latin-1) cells. Lines may
+# carry a score in the "WORD;score" format used by Crossword Nexus and
+# Spread the Wordlist; lines with a ";" that don't parse as one are skipped
+# and counted. Every word is upper-cased, since lists aren't consistent
+# about case. A word found in several lists is kept once, with its best
+# score.
+#
+# Lists are parsed a line at a time straight into the buckets, so reading
+# never holds more than the words kept plus one line.
+def read_word_list(
+    words_files: Union[str, Sequence[str]],
+    word_filter: Optional[WordListFilter] = None,
+) -> WordList:
+    words_files = _as_file_list(words_files)
+    words_by_length = {}
+    scores_by_length = {}
+    # length -> word -> id in its bucket; only needed to merge lists
+    word_ids_by_length = {} if len(words_files) > 1 else None
+    is_scored = False
+    num_malformed_lines = 0
+    for line in _iter_lines(words_files):
+        # represents a comment
+        if line.startswith("#"):
+            continue
+        word, score = _parse_line(line)
+        if not word or ";" in word:
+            num_malformed_lines += 1
+            continue
+        if score is None:
+            score = DEFAULT_SCORE
+        else:
+            is_scored = True
+        word = word.upper()
+        if any(ord(letter) > 255 for letter in word):
+            continue
+        if word_filter is not None and not word_filter.accepts(word, score):
+            continue
+
+        length = len(word)
+        if length not in words_by_length:
+            words_by_length[length] = []
+            scores_by_length[length] = array("i")
+            if word_ids_by_length is not None:
+                word_ids_by_length[length] = {}
+        if word_ids_by_length is not None:
+            word_ids = word_ids_by_length[length]
+            word_id = word_ids.get(word)
+            if word_id is not None:
+                scores = scores_by_length[length]
+                scores[word_id] = max(scores[word_id], score)
+                continue
+            word_ids[word] = len(word_ids)
+        words_by_length[length].append(word)
+        scores_by_length[length].append(score)
+    # not needed for the reordering below
+    word_ids_by_length = None
+
+    # shuffles an id permutation rather than the words themselves, which
+    # gives the same order without a (word, score) tuple per word
+    rng = random.Random(_WORD_ORDER_SEED)
+    for length in sorted(words_by_length):
+        words = words_by_length[length]
+        scores = scores_by_length[length]
+        order = list(range(len(words)))
+        rng.shuffle(order)
+        if is_scored:
+            order.sort(key=scores.__getitem__, reverse=True)
+        words_by_length[length] = [words[i] for i in order]
+        scores_by_length[length] = array("i", [scores[i] for i in order])
+    return WordList(
+        {length: words_by_length[length] for length in sorted(words_by_length)},
+        {length: scores_by_length[length] for length in sorted(scores_by_length)},
+        is_scored,
+        num_malformed_lines,
+    )
+
+
+# Yields the lines of each file in turn, without line breaks.
+def _iter_lines(words_files: List[str]) -> Iterator[str]:
+    for words_file in words_files:
+        with open(words_file, "r") as f:
+            for file_line in f:
+                # splitlines() also breaks on \v, \f and the like, which
+                # file iteration doesn't
+                yield from file_line.splitlines()
+
+
+def _as_file_list(words_files: Union[str, Sequence[str]]) -> List[str]:
+    if isinstance(words_files, str):
+        return [words_files]
+    return list(words_files)
+
+
+# Splits "WORD;score" into the word and its score. Lines without a valid
+# score come back whole, with a score of None; unless the line has no ";",
+# that leaves a ";" in the word.
+def _parse_line(line: str) -> Tuple[str, Optional[int]]:
+    word, separator, score = line.rpartition(";")
+    if not separator:
+        return line, None
+    try:
+        return word.strip(), int(score)
+    except ValueError:
+        return line, None
+
+
+# Builds length -> position -> letter -> bitset over words_by_length.
+def build_letter_index(
+    words_by_length: Dict[int, List[str]],
+) -> Dict[int, List[Dict[str, int]]]:
+    return {
+        length: [
+            _build_position_index(words, position)
+            for position in range(length)
+        ]
+        for length, words in words_by_length.items()
+    }
+
+
+# Builds letter -> bitset for a single position of a length bucket.
+def _build_position_index(words: List[str], position: int) -> Dict[str, int]:
+    column = "".join(word[position] for word in words)
+    index = {}
+    try:
+        column_bytes = column.encode("latin-1")
+    except UnicodeEncodeError:
+        column_bytes = None
+
+    for letter in set(column):
+        if column_bytes is None:
+            bits = "".join("1" if c == letter else "0" for c in column)
+        else:
+            # translate the column into a "0"/"1" string in one C-level pass
+            table = bytearray(b"0" * 256)
+            table[ord(letter)] = ord("1")
+            bits = column_bytes.translate(table)
+        index[letter] = int(bits[::-1], 2)
+    return index
+
+
+# Merged or filtered lists are cached next to the first list, under a
+# variant name of their own (see get_variant_name).
+def get_cache_path(words_file: str, variant: Optional[str] = None) -> str:
+    if variant is None:
+        return words_file + CACHE_SUFFIX
+    return f"{words_file}.{variant}{CACHE_SUFFIX}"
+
+
+def hash_file(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+# Identifies what a cache was compiled from: the sources' contents and the
+# filter. A single unfiltered list is identified by its own hash.
+def get_source_hash(
+    words_files: List[str],
+    word_filter: Optional[WordListFilter] = None,
+) -> bytes:
+    if len(words_files) == 1 and word_filter is None:
+        return hash_file(words_files[0])
+    digest = hashlib.sha256()
+    for words_file in words_files:
+        digest.update(hash_file(words_file))
+    digest.update(repr(word_filter).encode("utf-8"))
+    return digest.digest()
+
+
+# Names a merged or filtered list after its source paths and filter, but
+# not their contents. Every variant keeps one cache file, which is
+# recompiled in place when a source list changes, instead of each edit
+# leaving a new file behind.
+def get_variant_name(words_files: List[str], word_filter: Optional[WordListFilter]) -> str:
+    digest = hashlib.sha256()
+    for words_file in words_files:
+        digest.update(os.path.abspath(words_file).encode("utf-8") + b"\0")
+    digest.update(repr(word_filter).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+# Returns the compiled form of the word lists, compiling it first if the
+# cache is missing, stale or unreadable. Returns None if the cache cannot
+# be written either, in which case callers build the index in memory.
+def load_or_compile(
+    words_files: Union[str, Sequence[str]],
+    word_filter: Optional[WordListFilter] = None,
+) -> Optional['CompiledWordList']:
+    words_files = _as_file_list(words_files)
+    source_hash = get_source_hash(words_files, word_filter)
+    if len(words_files) == 1 and word_filter is None:
+        cache_path = get_cache_path(words_files[0])
+    else:
+        cache_path = get_cache_path(words_files[0], get_variant_name(words_files, word_filter))
+
+    compiled = CompiledWordList.open(cache_path, source_hash)
+    if compiled is not None:
+        return compiled
+
+    word_list = read_word_list(words_files, word_filter)
+    try:
+        write_compiled_word_list(
+            cache_path,
+            source_hash,
+            word_list,
+            build_letter_index(word_list.words_by_length),
+        )
+    except OSError:
+        return None
+    return CompiledWordList.open(cache_path, source_hash)
+
+
+def write_compiled_word_list(
+    cache_path: str,
+    source_hash: bytes,
+    word_list: WordList,
+    letter_index: Dict[int, List[Dict[str, int]]],
+) -> None:
+    words_by_length = word_list.words_by_length
+    lengths = sorted(words_by_length)
+    num_index_entries = {
+        length: sum(len(letters) for letters in letter_index[length])
+        for length in lengths
+    }
+
+    index_table_offset = _HEADER.size + _LENGTH_ENTRY.size * len(lengths)
+    data_offset = index_table_offset + _INDEX_ENTRY.size * sum(num_index_entries.values())
+
+    length_table = []
+    index_table = []
+    data = []
+    for length in lengths:
+        words_blob = "\n".join(words_by_length[length]).encode("utf-8")
+        scores_blob = word_list.scores_by_length[length].tobytes()
+        length_table.append(_LENGTH_ENTRY.pack(
+            length,
+            len(words_by_length[length]),
+            data_offset,
+            len(words_blob),
+            data_offset + len(words_blob),
+            num_index_entries[length],
+            index_table_offset,
+        ))
+        data.append(words_blob)
+        data.append(scores_blob)
+        data_offset += len(words_blob) + len(scores_blob)
+        index_table_offset += _INDEX_ENTRY.size * num_index_entries[length]
+
+    for length in lengths:
+        bitset_size = _bitset_size(len(words_by_length[length]))
+        for position, letters in enumerate(letter_index[length]):
+            for letter, mask in sorted(letters.items()):
+                index_table.append(_INDEX_ENTRY.pack(position, ord(letter), data_offset))
+                data.append(mask.to_bytes(bitset_size, "little"))
+                data_offset += bitset_size
+
+    # write to a temporary file and rename it into place, so concurrent
+    # readers only ever see a complete cache
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            flags = _FLAG_SCORED if word_list.is_scored else 0
+            f.write(_HEADER.pack(_MAGIC, CACHE_VERSION, source_hash, flags, len(lengths)))
+            f.writelines(length_table)
+            f.writelines(index_table)
+            f.writelines(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class CompiledWordList:
+    # length -> (#words, words offset, words size, scores offset,
+    #            #index entries, index offset)
+    length_table: Dict[int, Tuple[int, int, int, int, int, int]]
+    words_by_length: Mapping
+    scores_by_length: Mapping
+    letter_index: Mapping
+    is_scored: bool
+
+    def __init__(self, buffer: mmap.mmap):
+        self.buffer = buffer
+        _, _, _, flags, num_lengths = _HEADER.unpack_from(buffer, 0)
+        self.is_scored = bool(flags & _FLAG_SCORED)
+        self.length_table = {}
+        for i in range(num_lengths):
+            length, *rest = _LENGTH_ENTRY.unpack_from(
+                buffer,
+                _HEADER.size + i * _LENGTH_ENTRY.size,
+            )
+            self.length_table[length] = tuple(rest)
+
+        self.words_by_length = _LazyLengthMapping(self.length_table, self._load_words)
+        self.scores_by_length = _LazyLengthMapping(self.length_table, self._load_scores)
+        self.letter_index = _LazyLengthMapping(self.length_table, self._load_index)
+
+    # Maps the cache file, or returns None if it is missing or was compiled
+    # from a different source file or cache version.
+    @staticmethod
+    def open(cache_path: str, source_hash: bytes) -> Optional['CompiledWordList']:
+        try:
+            with open(cache_path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(buffer) < _HEADER.size:
+            return None
+        magic, version, cached_hash, _, _ = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC or version != CACHE_VERSION or cached_hash != source_hash:
+            return None
+        return CompiledWordList(buffer)
+
+    def _load_words(self, length: int) -> List[str]:
+        num_words, words_offset, words_size, _, _, _ = self.length_table[length]
+        if num_words == 0:
+            return []
+        blob = self.buffer[words_offset:words_offset + words_size]
+        return blob.decode("utf-8").split("\n")
+
+    def _load_scores(self, length: int) -> array:
+        num_words, _, _, scores_offset, _, _ = self.length_table[length]
+        scores = array("i")
+        scores.frombytes(self.buffer[scores_offset:scores_offset + num_words * scores.itemsize])
+        return scores
+
+    def _load_index(self, length: int) -> List[Dict[str, int]]:
+        num_words, _, _, _, num_index_entries, index_offset = self.length_table[length]
+        bitset_size = _bitset_size(num_words)
+        index = [dict() for _ in range(length)]
+        for i in range(num_index_entries):
+            position, code_point, offset = _INDEX_ENTRY.unpack_from(
+                self.buffer,
+                index_offset + i * _INDEX_ENTRY.size,
+            )
+            index[position][chr(code_point)] = int.from_bytes(
+                self.buffer[offset:offset + bitset_size],
+                "little",
+            )
+        return index
+
+
+# Read-only length -> value mapping that decodes a length's value from the
+# cache the first time it is looked up, so a process only copies the
+# buckets it actually touches out of the shared pages.
+class _LazyLengthMapping(Mapping):
+    def __init__(self, length_table: Dict[int, tuple], load_fn):
+        self._lengths = length_table
+        self._load_fn = load_fn
+        self._loaded = {}
+
+    def __getitem__(self, length: int):
+        if length not in self._loaded:
+            if length not in self._lengths:
+                raise KeyError(length)
+            self._loaded[length] = self._load_fn(length)
+        return self._loaded[length]
+
+    def __contains__(self, length) -> bool:
+        return length in self._lengths
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._lengths)
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+
+def _bitset_size(num_words: int) -> int:
+    return (num_words + 7) // 8
@@ -0,0 +1,38 @@
+"""One loaded PuzzleFiller shared by the workers of a process pool."""
+from typing import Optional
+
+from puzzle_filler import PuzzleFiller
+
+# Set in the parent before the pool forks, so workers inherit the loaded
+# dictionary instead of each loading their own.
+_worker_puzzle_filler: Optional[PuzzleFiller] = None
+
+
+# Loads a PuzzleFiller and decodes every length bucket, so that worker
+# processes forked afterwards share the decoded words and bitsets instead
+# of decoding their own copies.
+def load_warm_puzzle_filler(words_file: str) -> PuzzleFiller:
+    puzzle_filler = PuzzleFiller(words_file)
+    for length in puzzle_filler.word_filler.words_by_length:
+        puzzle_filler.word_filler.words_by_length[length]
+        puzzle_filler.word_filler.letter_index[length]
+    return puzzle_filler
+
+
+# Call in the parent before creating the pool.
+def load_worker_puzzle_filler(words_file: str) -> PuzzleFiller:
+    global _worker_puzzle_filler
+    _worker_puzzle_filler = load_warm_puzzle_filler(words_file)
+    return _worker_puzzle_filler
+
+
+# Call from the pool's initializer. Only loads anything where workers are
+# spawned rather than forked.
+def init_worker_puzzle_filler(words_file: str) -> None:
+    global _worker_puzzle_filler
+    if _worker_puzzle_filler is None:
+        _worker_puzzle_filler = PuzzleFiller(words_file)
+
+
+def get_worker_puzzle_filler() -> PuzzleFiller:
+    return _worker_puzzle_filler